@@ -1,7 +1,12 @@
 from flask import Flask
 from database import init_app, db
+import metrics
+from serialization import FastJSONProvider
 from services.customers.routes import user_bp
+from services.customers.auth import is_token_revoked
+from services.customers import wallet
 from services.inventory.routes import inventory_bp
+from services.inventory import search
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 import os
@@ -17,6 +22,8 @@ from services.sales.models import Sale
 load_dotenv()  
 
 app = Flask(__name__)
+# orjson-backed JSON encoding, with datetimes as ISO 8601
+app.json = FastJSONProvider(app)
 
 # Initialize database and migrations
 init_app(app)
@@ -24,6 +31,8 @@ init_app(app)
 # Initialize JWT
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'fallback-secret-key')
 jwt = JWTManager(app)
+# Reject tokens of deleted users or users whose role changed
+jwt.token_in_blocklist_loader(is_token_revoked)
 
 # Register blueprints
 app.register_blueprint(user_bp, url_prefix='/user')
@@ -32,6 +41,13 @@ app.register_blueprint(wishlist_bp, url_prefix='/wishlist')
 app.register_blueprint(sales_bp, url_prefix='/sales')
 app.register_blueprint(reviews_bp, url_prefix='/reviews')
 
+# Request metrics and the /metrics endpoint
+metrics.init_app(app)
+# Background compaction of wallet ledger snapshots
+wallet.init_app(app)
+# In-memory inventory search index, built with the first request
+search.init_app(app)
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+"""
+Concurrent checkout stress test.
+
+Many customers buy the same product at once through ``POST /sales/sale`` until
+it sells out. Afterwards the totals are checked: no unit may be oversold, every
+sold unit must have a sale row, and every wallet must be debited exactly by
+its sales. Throughput and the outcome of every request are printed.
+
+Run it against the configured database (MySQL; SQLite serializes all writers)::
+
+    python benchmarks/checkout_stress.py --threads 32 --customers 200 --stock 5000
+
+The benchmark creates its own product and ``bench-*`` customers and deletes
+them, with their sales, when it finishes.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from app import app, db  # noqa: E402
+from services.customers.models import User, WalletEntry, WalletSnapshot  # noqa: E402
+from services.customers.wallet import from_cents, get_balance  # noqa: E402
+from services.inventory.models import Inventory  # noqa: E402
+from services.sales.models import Sale  # noqa: E402
+
+PRICE = 1.0
+USER_PREFIX = "bench-"
+
+
+def setup(customers, stock, wallet):
+    with app.app_context():
+        product = Inventory(name="Checkout benchmark item", category="benchmark",
+                            price_per_item=PRICE, stock_count=stock)
+        db.session.add(product)
+        db.session.add_all([
+            User(full_name=f"Benchmark customer {index}", username=f"{USER_PREFIX}{index}",
+                 password="unused", role="customer", wallet_balance=wallet)
+            for index in range(customers)
+        ])
+        db.session.commit()
+        tokens = [create_access_token(identity=f"{USER_PREFIX}{index}") for index in range(customers)]
+        return product.id, tokens
+
+
+def teardown(product_id):
+    with app.app_context():
+        user_ids = db.select(User.id).where(User.username.startswith(USER_PREFIX))
+        WalletEntry.query.filter(WalletEntry.user_id.in_(user_ids)).delete(synchronize_session=False)
+        WalletSnapshot.query.filter(WalletSnapshot.user_id.in_(user_ids)).delete(synchronize_session=False)
+        Sale.query.filter(Sale.customer_username.startswith(USER_PREFIX)).delete(synchronize_session=False)
+        User.query.filter(User.username.startswith(USER_PREFIX)).delete(synchronize_session=False)
+        Inventory.query.filter_by(id=product_id).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def worker(product_id, tokens, quantity, sold_out, outcomes, lock):
+    client = app.test_client()
+    local = Counter()
+    tokens = list(tokens)
+    index = 0
+    # Stop when the product sold out or all customers of this worker are broke
+    while tokens and not sold_out.is_set():
+        index = (index + 1) % len(tokens)
+        response = client.post('/sales/sale', json={"product_id": product_id, "quantity": quantity},
+                               headers={"Authorization": f"Bearer {tokens[index]}"})
+        local[response.status_code] += 1
+        if response.status_code == 400 and b"Insufficient stock" in response.data:
+            sold_out.set()
+        elif response.status_code == 400 and b"Insufficient wallet balance" in response.data:
+            tokens.pop(index)
+    with lock:
+        outcomes.update(local)
+
+
+def verify(product_id, stock, customers, wallet):
+    """Return a list of violated invariants (empty when the totals are correct)."""
+    errors = []
+    with app.app_context():
+        remaining = db.session.get(Inventory, product_id).stock_count
+        sold = db.session.query(db.func.coalesce(db.func.sum(Sale.quantity), 0)).filter(
+            Sale.product_id == product_id).scalar()
+        if remaining < 0:
+            errors.append(f"stock went negative: {remaining}")
+        if sold + remaining != stock:
+            errors.append(f"sold {sold} + remaining {remaining} != initial stock {stock}")
+
+        spent = dict(db.session.query(Sale.customer_username, db.func.sum(Sale.total_price)).filter(
+            Sale.product_id == product_id).group_by(Sale.customer_username).all())
+        for user in User.query.filter(User.username.startswith(USER_PREFIX)):
+            balance = from_cents(get_balance(user.id))
+            expected = wallet - spent.get(user.username, 0.0)
+            if balance < 0 or abs(balance - expected) > 1e-6:
+                errors.append(f"{user.username}: wallet {balance} != expected {expected}")
+        return sold, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--stock", type=int, default=2000)
+    parser.add_argument("--quantity", type=int, default=1, help="units per sale")
+    parser.add_argument("--wallet", type=float, default=1000.0, help="initial balance of every customer")
+    args = parser.parse_args()
+
+    product_id, tokens = setup(args.customers, args.stock, args.wallet)
+    outcomes, lock, sold_out = Counter(), threading.Lock(), threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(product_id, tokens[index::args.threads] or tokens,
+                                              args.quantity, sold_out, outcomes, lock))
+        for index in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    try:
+        sold, errors = verify(product_id, args.stock, args.customers, args.wallet)
+    finally:
+        teardown(product_id)
+
+    print(f"threads={args.threads} customers={args.customers} stock={args.stock} quantity={args.quantity}")
+    print(f"elapsed {elapsed:.2f}s, {outcomes[200] / elapsed:.1f} sales/s, {sold} units sold")
+    print("responses by status: " + ", ".join(f"{status}={count}" for status, count in sorted(outcomes.items())))
+    if errors:
+        print("FAILED invariants:")
+        for error in errors:
+            print(f"  {error}")
+        sys.exit(1)
+    print("totals OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+JSON serialization benchmark for large listings.
+
+Times building the response of a purchase history listing of ``--rows`` sales
+two ways: the way the routes used to (load ORM instances, ``to_dict`` and
+Flask's default stdlib encoder) and the way they do now (project the columns,
+turn the rows into dictionaries and encode with :class:`FastJSONProvider`).
+Each way is run ``--repeat`` times and the best time is printed, split into
+the database read and the encoding.
+
+Run it against the configured database::
+
+    python benchmarks/serialization.py --rows 10000
+
+The benchmark inserts its own sales for a ``bench-serialization`` customer and
+deletes them when it finishes.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from app import app, db  # noqa: E402
+from serialization import FastJSONProvider, row_dicts  # noqa: E402
+import serialization  # noqa: E402
+from services.sales.models import SALE_COLUMNS, Sale  # noqa: E402
+
+CUSTOMER = "bench-serialization"
+
+
+def setup(rows):
+    with app.app_context():
+        start = datetime(2024, 1, 1)
+        db.session.execute(db.insert(Sale), [
+            {"customer_username": CUSTOMER, "product_id": index % 100, "product_name": f"Product {index % 100}",
+             "quantity": 1 + index % 5, "total_price": 9.99 * (1 + index % 5),
+             "timestamp": start + timedelta(minutes=index)}
+            for index in range(rows)
+        ])
+        db.session.commit()
+
+
+def teardown():
+    with app.app_context():
+        Sale.query.filter_by(customer_username=CUSTOMER).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def orm_to_dict():
+    sales = Sale.query.filter_by(customer_username=CUSTOMER).all()
+    return [sale.to_dict() for sale in sales]
+
+
+def projected_rows():
+    return row_dicts(db.session.execute(db.select(*SALE_COLUMNS).where(Sale.customer_username == CUSTOMER)))
+
+
+def measure(load, provider, repeat):
+    """Return the best (load, encode) times in seconds and the response size in bytes."""
+    best_load = best_encode = float("inf")
+    size = 0
+    with app.app_context():
+        for _ in range(repeat):
+            db.session.expunge_all()
+            started = time.perf_counter()
+            data = load()
+            loaded = time.perf_counter()
+            body = provider.response(data).get_data()
+            encoded = time.perf_counter()
+            best_load = min(best_load, loaded - started)
+            best_encode = min(best_encode, encoded - loaded)
+            size = len(body)
+        db.session.remove()
+    return best_load, best_encode, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup(args.rows)
+    try:
+        runs = [("before: ORM + to_dict + stdlib", orm_to_dict, DefaultJSONProvider(app))]
+        if serialization.orjson is None:
+            print("orjson is not installed, FastJSONProvider falls back to the standard library")
+        runs.append(("after: projected rows + FastJSONProvider", projected_rows, FastJSONProvider(app)))
+        print(f"{args.rows} rows, best of {args.repeat}")
+        for label, load, provider in runs:
+            load_time, encode_time, size = measure(load, provider, args.repeat)
+            print(f"{label:45} load {load_time * 1000:8.1f} ms  encode {encode_time * 1000:8.1f} ms  "
+                  f"total {(load_time + encode_time) * 1000:8.1f} ms  {size / 1024:8.0f} KiB")
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
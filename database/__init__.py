@@ -1,8 +1,70 @@
+import os
+from flask import has_app_context, jsonify
+from sqlalchemy import event
 from .db_config import db, Config
 from flask_migrate import Migrate
+from . import query_stats, routing
+from .pool import engine_options, pool_stats
+import metrics
 migrate = Migrate()
 
+# Seconds a MySQL statement waits for a row lock before failing (server default: 50)
+LOCK_WAIT_TIMEOUT = int(os.getenv("DB_LOCK_WAIT_TIMEOUT", "2"))
+
+
+def _set_lock_wait_timeout(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET SESSION innodb_lock_wait_timeout = {LOCK_WAIT_TIMEOUT}")
+    cursor.close()
+
+
+def _pool_collector():
+    if not has_app_context():
+        return
+    stats = pool_stats(db.engines)
+    for name, documentation in (
+        ("size", "Connections the pool keeps open."),
+        ("checked_out", "Connections currently in use."),
+        ("overflow", "Connections open beyond the pool size."),
+        ("waiters", "Threads waiting for a connection."),
+    ):
+        yield f"# HELP db_pool_{name} {documentation}"
+        yield f"# TYPE db_pool_{name} gauge"
+        for bind, values in stats.items():
+            yield metrics.format_sample(f"db_pool_{name}", (("bind", bind),), values[name])
+
+
+metrics.register_collector(_pool_collector)
+
+
+def pool_health():
+    """
+    Report the live state of the connection pools, to size workers against
+    database connections.
+
+    :return: A JSON response with, per bind, the pool size and the checked
+             out, overflow and waiting connections.
+    """
+    return jsonify(pool_stats(db.engines)), 200
+
+
 def init_app(app):
-    app.config.from_object(Config)
+    # Settings made on the app beforehand (e.g. by tests) take precedence
+    for key in dir(Config):
+        if key.isupper():
+            app.config.setdefault(key, getattr(Config, key))
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config["SQLALCHEMY_DATABASE_URI"]))
+    app.config["SQLALCHEMY_BINDS"] = {
+        key: bind if isinstance(bind, dict) else {"url": bind, **engine_options(bind)}
+        for key, bind in app.config["SQLALCHEMY_BINDS"].items()
+    }
     db.init_app(app)
     migrate.init_app(app, db)
+    query_stats.init_app(app)
+    routing.init_app(app)
+    # Contended writes fail fast instead of queueing behind a lock
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "mysql":
+                event.listen(engine, "connect", _set_lock_wait_timeout)
+    app.add_url_rule("/health/db", "pool_health", pool_health, methods=["GET"])
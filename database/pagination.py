@@ -0,0 +1,156 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+from sqlalchemy import DateTime, and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Rows fetched per round trip when iterating over a whole table
+EXPORT_BATCH_SIZE = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def page_args(default_limit=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE):
+    """
+    Read the ``limit`` and ``after`` query parameters of the current request.
+
+    :param default_limit: Page size used when ``limit`` is missing.
+    :param max_limit: Largest page size a client may ask for.
+    :return: A tuple (limit, after); ``after`` is None for the first page.
+    :raises ValueError: If a parameter is not an integer or ``limit`` is out of range.
+    """
+    return limit_arg(default_limit, max_limit), _int_arg("after", None)
+
+
+def limit_arg(default_limit=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE):
+    """
+    Read the ``limit`` query parameter of the current request.
+
+    :raises ValueError: If ``limit`` is not an integer between 1 and ``max_limit``.
+    """
+    limit = _int_arg("limit", default_limit)
+    if not 1 <= limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+    return limit
+
+
+def _int_arg(name, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+def keyset_page(query, column, limit, after=None):
+    """
+    Fetch one page of ``query`` ordered by the unique ``column``.
+
+    Pages are addressed by the last key of the previous page instead of an
+    offset, so every page is an index range scan whatever its position.
+
+    :param query: The query to paginate, without ORDER BY or LIMIT.
+    :param column: Unique, indexed column to order by (usually the primary key).
+    :param limit: Maximum number of rows in the page.
+    :param after: Key of the last row of the previous page, or None for the first page.
+    :return: A tuple (rows, next_cursor); ``next_cursor`` is None on the last page.
+    """
+    if after is not None:
+        query = query.filter(column > after)
+    # One extra row tells whether another page follows
+    rows = query.order_by(column).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, getattr(rows[-1], column.key)
+
+
+def iter_keyset(query, column, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Iterate over all rows of ``query`` in keyset-paginated batches, so at most
+    ``batch_size`` rows are held in memory whatever the size of the table.
+
+    :param query: The query to iterate, without ORDER BY or LIMIT.
+    :param column: Unique, indexed column to order by (usually the primary key).
+    :param batch_size: Number of rows fetched per statement.
+    :return: A generator of rows in ``column`` order.
+    """
+    after = None
+    while True:
+        rows, after = keyset_page(query, column, batch_size, after)
+        yield from rows
+        if after is None:
+            return
+
+
+def encode_cursor(values):
+    """Encode the sort key of a row as an opaque, URL-safe cursor; datetimes are written in ISO 8601."""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor created by :func:`encode_cursor`.
+
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def seek_page(query, columns, limit, cursor=None, descending=False):
+    """
+    Fetch one page of ``query`` ordered by a composite key.
+
+    :param query: The query to paginate, without ORDER BY or LIMIT.
+    :param columns: Columns of the sort key; together they must be unique, so
+                    the last one is usually the primary key.
+    :param limit: Maximum number of rows in the page.
+    :param cursor: Cursor returned with the previous page, or None for the first page.
+    :param descending: Sort all columns in descending order.
+    :return: A tuple (rows, next_cursor); ``next_cursor`` is None on the last page.
+    :raises ValueError: If the cursor is malformed.
+    """
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if len(values) != len(columns):
+            raise ValueError("Invalid cursor")
+        values = [_column_value(column, value) for column, value in zip(columns, values)]
+        query = query.filter(_seek_condition(columns, values, descending))
+    order = [column.desc() if descending else column for column in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+
+def _column_value(column, value):
+    # Datetimes come back from the cursor as ISO 8601 strings
+    if value is None or not isinstance(column.type, DateTime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def _seek_condition(columns, values, descending):
+    # (a, b) > (x, y) spelled out as a > x OR (a = x AND b > y), which MySQL
+    # can resolve with an index range scan unlike the row value comparison
+    clauses = []
+    for index, column in enumerate(columns):
+        equal = [previous == value for previous, value in zip(columns[:index], values[:index])]
+        past = column < values[index] if descending else column > values[index]
+        clauses.append(and_(*equal, past))
+    return or_(*clauses)
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+import metrics
+
+# Connections kept open per process, and extra ones opened under load and closed when returned
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections older than this many seconds are replaced; keep it below MySQL's wait_timeout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test connections with a round trip on checkout, so a dropped one is replaced instead of failing the request
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+CHECKOUT_WAIT = metrics.histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the pool, including opening a new one.",
+).labels()
+CHECKOUT_TIMEOUTS = metrics.counter(
+    "db_pool_timeouts_total", "Connection checkouts that gave up after DB_POOL_TIMEOUT seconds.",
+).labels()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    :class:`QueuePool` timing every checkout and counting the threads waiting
+    for a connection because the pool and its overflow are all checked out,
+    to tell when requests queue on the pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiters = 0
+        self._waiters_lock = threading.Lock()
+
+    def waiters(self):
+        """Return the number of threads currently waiting for a connection."""
+        return self._waiters
+
+    def _exhausted(self):
+        # No idle connection and no room to open another one: the checkout will block
+        return (self._pool.empty() and self._max_overflow > -1
+                and self.checkedout() >= self.size() + self._max_overflow)
+
+    def _do_get(self):
+        waiting = self._exhausted()
+        if waiting:
+            with self._waiters_lock:
+                self._waiters += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            CHECKOUT_WAIT.observe(time.perf_counter() - start)
+            if waiting:
+                with self._waiters_lock:
+                    self._waiters -= 1
+
+
+def engine_options(uri):
+    """
+    Return the SQLAlchemy engine options for ``uri``, read from the ``DB_POOL_*``
+    environment variables, so each service can size its own pool.
+
+    SQLite keeps the pool SQLAlchemy chooses for it.
+    """
+    if make_url(uri).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def pool_stats(engines):
+    """
+    Return the live state of the pools of ``engines``.
+
+    :param engines: Mapping of bind key (None for the default) to engine, as ``db.engines``.
+    :return: A dictionary of bind name ("default" for the default bind) to the
+             pool size, checked out and overflow connections and waiting threads.
+    """
+    stats = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        stats[key or "default"] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            # Negative while fewer connections than pool_size are open
+            "overflow": max(pool.overflow(), 0),
+            "waiters": pool.waiters() if isinstance(pool, InstrumentedQueuePool) else 0,
+        }
+    return stats
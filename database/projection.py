@@ -0,0 +1,41 @@
+from flask import request
+
+
+def fields_arg(columns):
+    """
+    Read the ``fields`` query parameter of the current request: a comma-separated
+    list of the fields a client wants, to select only those columns.
+
+    :param columns: Columns (or labeled expressions) the client may ask for,
+                    named by their ``key``; this is the whitelist.
+    :return: The requested columns, in the order of ``columns``; all of them
+             when ``fields`` is missing.
+    :raises ValueError: If ``fields`` is empty or names an unknown field.
+    """
+    value = request.args.get("fields")
+    if value is None:
+        return tuple(columns)
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    allowed = [column.key for column in columns]
+    if not requested or not requested.issubset(allowed):
+        raise ValueError(f"fields must be a comma-separated list of {', '.join(allowed)}")
+    return tuple(column for column in columns if column.key in requested)
+
+
+def pick(items, fields):
+    """
+    Apply a projection to dictionaries that are already loaded, e.g. cached.
+
+    :param fields: Columns returned by :func:`fields_arg`.
+    """
+    keys = [column.key for column in fields]
+    return [{key: item[key] for key in keys} for item in items]
+
+
+def with_columns(fields, required):
+    """
+    Add the ``required`` columns missing from ``fields``, e.g. the sort key a
+    cursor is built from, to a projection.
+    """
+    selected = {column.key for column in fields}
+    return tuple(fields) + tuple(column for column in required if column.key not in selected)
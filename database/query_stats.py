@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+import time
+from contextlib import ContextDecorator
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import metrics
+from utils import profiling_sink
+
+# Statements slower than this are aggregated in the slow query log
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_OUTPUT_FILE = "slow_queries.log"
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+QUERY_TIME_HEADER = "X-DB-Time-Ms"
+
+QUERIES_PER_REQUEST = metrics.histogram(
+    "db_queries_per_request", "Number of SQL statements executed per request, by endpoint.", ("endpoint",),
+    bounds=[0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100],
+)
+DB_TIME = metrics.histogram("db_time_seconds", "Time spent executing SQL per request, by endpoint.", ("endpoint",))
+SLOW_QUERIES = metrics.counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_THRESHOLD_MS.").labels()
+
+_LITERALS = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), "?"),         # string literals
+    (re.compile(r"%\(\w+\)s|%s|:\w+|\?"), "?"),          # bound parameters of any paramstyle
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),              # numbers
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?+)"),  # IN lists of any length
+    (re.compile(r"\s+"), " "),
+]
+
+
+def fingerprint(statement):
+    """
+    Normalize a SQL statement so that executions differing only in literal
+    values, bound parameters or IN list lengths share one fingerprint.
+
+    :param statement: The SQL statement as sent to the driver.
+    :return: The normalized statement.
+    """
+    normalized = statement.strip()
+    for pattern, replacement in _LITERALS:
+        normalized = pattern.sub(replacement, normalized)
+    return normalized
+
+
+class SlowQueryLog:
+    """
+    Slow statements aggregated by fingerprint (count, total and max time).
+    The aggregates are written to ``slow_queries.log`` by the profiling sink
+    at every flush and reset afterwards.
+    """
+
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement, elapsed):
+        """Add one execution of ``statement`` that took ``elapsed`` seconds."""
+        key = fingerprint(statement)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"count": 0, "total": 0.0, "max": 0.0}
+            entry["count"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+        SLOW_QUERIES.inc()
+
+    def collect(self):
+        """Return the aggregates since the last call as text and reset them."""
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        if not entries:
+            return None
+        lines = [f"\nSlow queries (>= {self.threshold * 1000:.0f} ms), window ending {time.strftime('%Y-%m-%d %H:%M:%S')}\n"]
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["total"], reverse=True):
+            lines.append(
+                f"count={entry['count']} total={entry['total'] * 1000:.1f}ms "
+                f"max={entry['max'] * 1000:.1f}ms avg={entry['total'] / entry['count'] * 1000:.1f}ms\n"
+                f"  {key}\n"
+            )
+        return "".join(lines)
+
+
+slow_query_log = SlowQueryLog()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    record_query(statement, elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # after_cursor_execute is not called for failed statements
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+_budgets = threading.local()
+
+
+class query_budget(ContextDecorator):
+    """
+    Assert that at most ``limit`` SQL statements run inside the block.
+
+    Works as a context manager or as a decorator, and counts the statements
+    executed by the current thread, which includes requests issued through the
+    Flask test client::
+
+        with query_budget(5):
+            client.post('/sales/sale', json=payload, headers=headers)
+
+    :param limit: Maximum number of statements allowed.
+    :raises AssertionError: On exit, if more statements were executed; the
+                            message lists all of them.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self.statements = []
+        if not hasattr(_budgets, "active"):
+            _budgets.active = []
+        _budgets.active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _budgets.active.remove(self)
+        if exc_type is None and self.count > self.limit:
+            executed = "\n".join(f"  {statement}" for statement in self.statements)
+            raise AssertionError(
+                f"Query budget exceeded: {self.count} statements executed, at most {self.limit} allowed:\n{executed}"
+            )
+        return False
+
+
+def record_query(statement, elapsed):
+    """
+    Account one executed statement to the current request, active query
+    budgets and, when it is slow, to the slow query log.
+    """
+    for budget in getattr(_budgets, "active", ()):
+        budget.statements.append(statement)
+    if has_request_context():
+        g.db_query_count = g.get("db_query_count", 0) + 1
+        g.db_time = g.get("db_time", 0.0) + elapsed
+    if elapsed >= slow_query_log.threshold:
+        slow_query_log.record(statement, elapsed)
+
+
+def _add_query_stats(response):
+    count = g.get("db_query_count", 0)
+    elapsed = g.get("db_time", 0.0)
+    response.headers[QUERY_COUNT_HEADER] = str(count)
+    response.headers[QUERY_TIME_HEADER] = f"{elapsed * 1000:.2f}"
+    endpoint = request.endpoint or "unmatched"
+    QUERIES_PER_REQUEST.labels(endpoint).observe(count)
+    DB_TIME.labels(endpoint).observe(elapsed)
+    return response
+
+
+def init_app(app):
+    """
+    Attach the number of queries and the DB time of every request to its
+    response headers and metrics, and start writing the slow query log.
+    """
+    app.after_request(_add_query_stats)
+    profiling_sink.register_flusher(SLOW_QUERY_OUTPUT_FILE, slow_query_log.collect)
@@ -0,0 +1,145 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_sqlalchemy.session import Session
+
+# Binds named like this (e.g. "replica1") are read replicas of the default bind
+REPLICA_BIND_PREFIX = "replica"
+# Seconds after a write during which the writer's reads go to the primary
+READ_YOUR_WRITES_WINDOW = float(os.getenv("DB_READ_YOUR_WRITES_WINDOW", "5"))
+# Set on responses to requests that wrote, so other processes also honour the window
+LAST_WRITE_COOKIE = "db_last_write"
+
+
+class RecentWriters:
+    """
+    In-process record of the users who wrote within the last ``window`` seconds.
+    """
+
+    def __init__(self, window=READ_YOUR_WRITES_WINDOW):
+        self.window = window
+        self._writes = {}  # identity -> time of the last write
+        self._lock = threading.Lock()
+
+    def record(self, identity):
+        now = time.time()
+        with self._lock:
+            self._writes[identity] = now
+            # Forget writers whose window is over, so the map stays small
+            expired = [key for key, written in self._writes.items() if written < now - self.window]
+            for key in expired:
+                del self._writes[key]
+
+    def wrote_recently(self, identity):
+        with self._lock:
+            written = self._writes.get(identity)
+        return written is not None and written >= time.time() - self.window
+
+
+recent_writers = RecentWriters()
+
+
+class RoutingSession(Session):
+    """
+    Session sending the reads of :func:`use_replica` routes to a replica bind
+    and everything else to the primary.
+
+    Within such a request, flushes, INSERT/UPDATE/DELETE statements and locking
+    reads still go to the primary, and :func:`use_primary` forces it for a block.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if not has_request_context():
+            return engine
+        engines = self._db.engines
+        if self._flushing or getattr(clause, "is_dml", False) or getattr(clause, "_for_update_arg", None) is not None:
+            g.db_wrote = True
+            return engine
+        replica = g.get("db_replica")
+        if replica is None or g.get("db_force_primary") or engine is not engines.get(None):
+            return engine
+        return engines[replica]
+
+
+def replica_binds(engines):
+    """Return the bind keys of the read replicas among ``engines``."""
+    return [key for key in engines if key and key.startswith(REPLICA_BIND_PREFIX)]
+
+
+def _identity():
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        # Rejecting a bad token is up to the route, not the routing
+        return None
+
+
+def _wrote_recently():
+    last_write = request.cookies.get(LAST_WRITE_COOKIE)
+    try:
+        if last_write is not None and float(last_write) >= time.time() - READ_YOUR_WRITES_WINDOW:
+            return True
+    except ValueError:
+        pass
+    identity = _identity()
+    return identity is not None and recent_writers.wrote_recently(identity)
+
+
+def use_replica(func):
+    """
+    Decorator sending the queries of a read-only route to a random read
+    replica, if any is configured. Users who wrote within the last
+    ``READ_YOUR_WRITES_WINDOW`` seconds keep reading from the primary, so they
+    see their own writes despite replication lag.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        replicas = replica_binds(current_app.extensions["sqlalchemy"].engines)
+        if replicas and not _wrote_recently():
+            g.db_replica = random.choice(replicas)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def use_primary():
+    """Run the queries of the block on the primary, e.g. to fill a cache shared by all requests."""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get("db_force_primary")
+    g.db_force_primary = True
+    try:
+        yield
+    finally:
+        g.db_force_primary = previous
+
+
+def _record_write(response):
+    if g.get("db_wrote") and response.status_code < 400:
+        response.set_cookie(LAST_WRITE_COOKIE, f"{time.time():.3f}", max_age=int(READ_YOUR_WRITES_WINDOW) + 1,
+                            httponly=True)
+        try:
+            identity = get_jwt_identity()
+        except RuntimeError:
+            identity = None
+        if identity is not None:
+            recent_writers.record(identity)
+    return response
+
+
+def init_app(app):
+    """
+    Remember which users wrote, to keep their reads on the primary for a
+    while. Without replicas every read is on the primary already, so writes
+    are neither recorded nor marked with a cookie.
+    """
+    if replica_binds(app.config.get("SQLALCHEMY_BINDS") or {}):
+        app.after_request(_record_write)
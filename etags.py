@@ -0,0 +1,135 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+from flask import g, has_request_context, make_response, request
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from database.db_config import db
+from database.routing import use_primary
+
+
+class ResourceVersion(db.Model):
+    """Current version of a resource, or of one key of it; see :class:`VersionCounter`."""
+    __tablename__ = 'resource_versions'
+
+    name = db.Column(db.String(50), primary_key=True)
+    key = db.Column(db.String(50), primary_key=True)  # '' for the whole resource
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class VersionCounter:
+    """
+    Version numbers of a table, or of the rows belonging to one key of it
+    (e.g. the reviews of one product), to derive ETags from.
+
+    The versions are rows of ``resource_versions``, so every process derives
+    the same ETag from the same data. Writers call :meth:`bump` after their
+    commit; readers look the version up by primary key, once per request. A
+    process that dies between the commit and the bump leaves the old version
+    in place until the next write.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def current(self, key=None):
+        """Return the current version of ``key``; 0 if it was never bumped."""
+        cache = g.setdefault("resource_versions", {}) if has_request_context() else {}
+        if (self.name, key) not in cache:
+            # Versions follow commits on the primary, which a replica may not have yet
+            with use_primary():
+                version = db.session.execute(
+                    db.select(ResourceVersion.version).where(
+                        ResourceVersion.name == self.name, ResourceVersion.key == self._key(key),
+                    )
+                ).scalar()
+            cache[self.name, key] = version or 0
+        return cache[self.name, key]
+
+    def etag(self, key=None):
+        """Return the strong ETag of the current version of ``key``."""
+        return f"{self.name}-{self._key(key)}-{self.current(key)}"
+
+    def bump(self, *keys):
+        """
+        Start a new version of ``keys``, or of the whole resource when none is
+        given, in a transaction of its own on the primary.
+        """
+        cache = g.get("resource_versions", {}) if has_request_context() else {}
+        with db.engine.begin() as connection:
+            for key in keys or (None,):
+                cache.pop((self.name, key), None)
+                self._increment(connection, self._key(key))
+
+    def _increment(self, connection, key):
+        columns = ResourceVersion.__table__.c
+        increment = (
+            update(ResourceVersion)
+            .where(columns.name == self.name, columns.key == key)
+            .values(version=columns.version + 1)
+        )
+        if connection.execute(increment).rowcount:
+            return
+        try:
+            # First bump of the key; a savepoint keeps the transaction usable if another one won
+            with connection.begin_nested():
+                connection.execute(insert(ResourceVersion).values(name=self.name, key=key, version=1))
+        except IntegrityError:
+            connection.execute(increment)
+
+    @staticmethod
+    def _key(key):
+        return "" if key is None else str(key)
+
+
+def _query_tag(args):
+    # Digest of the query string, which selects what the response holds (fields,
+    # page, sort...); normalized so that equivalent queries share an ETag
+    pairs = []
+    for name in sorted(args):
+        values = args.getlist(name)
+        if name == "fields":
+            values = [",".join(sorted({field.strip() for value in values for field in value.split(",") if field.strip()}))]
+        pairs.extend((name, value) for value in values)
+    if not pairs:
+        return ""
+    return "-" + hashlib.sha1(urlencode(pairs).encode()).hexdigest()[:16]
+
+
+def conditional(versions, key=None):
+    """
+    Decorator answering conditional GETs of a route from a :class:`VersionCounter`.
+
+    The ETag is looked up before the view runs, so a request whose
+    ``If-None-Match`` holds the current ETag gets 304 Not Modified with a
+    single primary key query and no serialization. Successful responses carry
+    the ETag, which also covers the normalized query string (``fields``,
+    ``limit``, ``cursor``, ``sort``...), so different pages and projections of
+    the same version get different ETags. The view reads from the primary,
+    even under :func:`~database.routing.use_replica`: the versions follow
+    writes to the primary, and a lagging replica would pair an old body with a
+    new ETag.
+    Since the ETag is taken before the data is read and writers bump it after
+    their commit, a concurrent write can only make the body newer than its
+    ETag, never older.
+
+    :param versions: The :class:`VersionCounter` of the data the route returns.
+    :param key: Function of the view arguments returning the version key, e.g.
+                ``lambda product_id: product_id``; None for a single version.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = versions.etag(key(**kwargs) if key else None) + _query_tag(request.args)
+            if request.if_none_match.contains(etag):
+                response = make_response("", 304)
+                response.set_etag(etag)
+                return response
+
+            with use_primary():
+                response = make_response(func(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
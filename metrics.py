@@ -0,0 +1,315 @@
+import bisect
+import threading
+import time
+from flask import Response, g, request
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+LATENCY_SUB_BUCKETS = 8
+
+
+def latency_bounds(lowest=0.0001, highest=60.0, sub_buckets=LATENCY_SUB_BUCKETS):
+    """
+    HDR-style bucket upper bounds: every power of two between ``lowest`` and
+    ``highest`` is split into ``sub_buckets`` linear buckets, which keeps the
+    relative error of any quantile below ``1 / sub_buckets``.
+
+    :return: A sorted list of bucket upper bounds in seconds.
+    """
+    bounds = []
+    base = lowest
+    while base < highest:
+        step = base / sub_buckets
+        bounds.extend(base + step * i for i in range(1, sub_buckets + 1))
+        base *= 2
+    return bounds
+
+
+DEFAULT_LATENCY_BOUNDS = latency_bounds()
+
+
+def _format_value(value):
+    if isinstance(value, float) and value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(_format_value(value))}"' for name, value in labels) + "}"
+
+
+def format_sample(name, labels, value):
+    """
+    Format one sample in Prometheus text format.
+
+    :param labels: Sequence of (label name, label value) pairs.
+    """
+    return f"{name}{_format_labels(labels)} {_format_value(value)}"
+
+
+class CounterValue:
+    """A monotonically increasing value."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield format_sample(name, labels, self.value)
+
+
+class GaugeValue(CounterValue):
+    """A value that can go up and down."""
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+
+class HistogramValue:
+    """
+    Fixed-bucket latency histogram.
+
+    The bucket lookup happens outside the lock; the lock only guards three
+    integer/float increments, so concurrent observers barely contend. Only every
+    ``export_every``-th bucket is exported as a Prometheus ``le`` bucket, while
+    the quantiles are computed from all buckets.
+    """
+
+    def __init__(self, bounds, export_every=1):
+        self.bounds = bounds
+        self.export_every = export_every
+        self.counts = [0] * (len(bounds) + 1)  # last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q, counts=None):
+        """
+        Estimate the ``q`` quantile (0 < q <= 1) by interpolating inside the bucket
+        that contains it. Returns 0.0 when nothing has been observed.
+        """
+        if counts is None:
+            counts = self.snapshot()[0]
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                upper = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def samples(self, name, labels):
+        counts, total_sum, total_count = self.snapshot()
+        cumulative = 0
+        for index, bound in enumerate(self.bounds):
+            cumulative += counts[index]
+            if (index + 1) % self.export_every == 0:
+                yield format_sample(f"{name}_bucket", list(labels) + [("le", bound)], cumulative)
+        yield format_sample(f"{name}_bucket", list(labels) + [("le", float("inf"))], total_count)
+        yield format_sample(f"{name}_sum", labels, total_sum)
+        yield format_sample(f"{name}_count", labels, total_count)
+
+    def quantile_samples(self, name, labels):
+        counts = self.snapshot()[0]
+        for q in QUANTILES:
+            yield format_sample(name, list(labels) + [("quantile", q)], self.quantile(q, counts))
+
+
+class MetricFamily:
+    """
+    A named metric with a fixed set of label names. Each combination of label
+    values gets its own child created on first use by :meth:`labels`.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames=(), factory=CounterValue):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Return the child for the given label values, in ``labelnames`` order."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def render(self):
+        children = sorted(self._children.items())
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, child in children:
+            yield from child.samples(self.name, list(zip(self.labelnames, key)))
+        if self.kind == "histogram":
+            # Quantiles estimated from the full resolution buckets, e.g. p50/p99 per endpoint
+            name = f"{self.name}_quantile"
+            yield f"# HELP {name} Estimated quantiles of {self.name}."
+            yield f"# TYPE {name} gauge"
+            for key, child in children:
+                yield from child.quantile_samples(name, list(zip(self.labelnames, key)))
+
+
+class Registry:
+    """Holds metric families and collector callbacks and renders them as text."""
+
+    def __init__(self):
+        self._families = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, family):
+        with self._lock:
+            return self._families.setdefault(family.name, family)
+
+    def register_collector(self, collector):
+        """
+        Add a callable that returns exposition lines (see :func:`format_sample`)
+        computed at scrape time, e.g. connection pool or queue statistics.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            families = list(self._families.values())
+            collectors = list(self._collectors)
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        for collector in collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    """Create (or return the already registered) counter family ``name``."""
+    return REGISTRY.register(MetricFamily(name, documentation, "counter", labelnames, CounterValue))
+
+
+def gauge(name, documentation, labelnames=()):
+    """Create (or return the already registered) gauge family ``name``."""
+    return REGISTRY.register(MetricFamily(name, documentation, "gauge", labelnames, GaugeValue))
+
+
+def histogram(name, documentation, labelnames=(), bounds=None):
+    """
+    Create (or return the already registered) histogram family ``name``.
+
+    :param bounds: Bucket upper bounds; defaults to :data:`DEFAULT_LATENCY_BOUNDS`,
+                   of which only the power-of-two bounds are exported.
+    """
+    export_every = 1
+    if bounds is None:
+        bounds, export_every = DEFAULT_LATENCY_BOUNDS, LATENCY_SUB_BUCKETS
+    return REGISTRY.register(
+        MetricFamily(name, documentation, "histogram", labelnames, lambda: HistogramValue(bounds, export_every))
+    )
+
+
+def register_collector(collector):
+    """Register a scrape-time collector on the default registry."""
+    REGISTRY.register_collector(collector)
+
+
+REQUESTS = counter("http_requests_total", "Requests handled, by endpoint, method and status code.",
+                   ("endpoint", "method", "status"))
+IN_FLIGHT = gauge("http_requests_in_flight", "Requests currently being handled, by endpoint.", ("endpoint",))
+LATENCY = histogram("http_request_duration_seconds", "Request latency in seconds, by endpoint.", ("endpoint",))
+
+
+def _profiling_collector():
+    from utils import profiling_sink
+    yield "# HELP profiling_results_dropped_total Profiling results dropped because the sink queue was full."
+    yield "# TYPE profiling_results_dropped_total counter"
+    yield format_sample("profiling_results_dropped_total", (), profiling_sink.dropped)
+    yield "# HELP profiling_results_failed_total Profiling results that could not be formatted or written."
+    yield "# TYPE profiling_results_failed_total counter"
+    yield format_sample("profiling_results_failed_total", (), profiling_sink.failed)
+
+
+register_collector(_profiling_collector)
+
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+
+def _start_timer():
+    g._metrics_start = time.perf_counter()
+    IN_FLIGHT.labels(_endpoint()).inc()
+
+
+def _record_request(response):
+    start = g.get("_metrics_start")
+    if start is not None:
+        endpoint = _endpoint()
+        LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+        REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+
+def _finish_request(exc=None):
+    if g.pop("_metrics_start", None) is not None:
+        IN_FLIGHT.labels(_endpoint()).dec()
+
+
+def metrics_view():
+    """
+    Expose all registered metrics in Prometheus text format.
+
+    :return: A text response in Prometheus exposition format.
+    """
+    return Response(REGISTRY.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def init_app(app):
+    """
+    Register the request hooks that record latency, status codes and in-flight
+    requests per endpoint, and the ``/metrics`` route.
+    """
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.teardown_request(_finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
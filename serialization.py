@@ -0,0 +1,81 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard library encoder is used instead
+    orjson = None
+
+
+def _default(obj):
+    # Types neither encoder handles natively; datetimes only reach here without orjson
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON provider encoding with orjson when it is installed, and with the
+    standard library otherwise.
+
+    Both produce the same output: compact, keys in insertion order, non-ASCII
+    characters unescaped and datetimes as ISO 8601 strings. Responses are
+    indented in debug mode, like with Flask's default provider.
+    """
+
+    mimetype = "application/json"
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self._app.debug:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=_default, option=self._options()).decode()
+        kwargs.setdefault("default", _default)
+        kwargs.setdefault("ensure_ascii", False)
+        if self._app.debug:
+            kwargs.setdefault("indent", 2)
+        else:
+            kwargs.setdefault("separators", (",", ":"))
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            # orjson encodes straight to bytes, so skip decoding to str and back
+            body = orjson.dumps(obj, default=_default, option=self._options())
+        else:
+            body = self.dumps(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def row_dicts(rows, keys=None):
+    """
+    Serialize the rows of a column-projected query (e.g. ``db.select(*COLUMNS)``)
+    as dictionaries keyed by column name, without loading ORM instances.
+
+    :param keys: Only keep these columns, e.g. when the query selected extra
+                 columns to build a cursor from.
+    """
+    if keys is None:
+        return [row._asdict() for row in rows]
+    return [{key: row._mapping[key] for key in keys} for row in rows]
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+from flask import g, jsonify
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity
+from .models import User
+
+# Lifetime of access tokens; revocations are kept exactly as long. Revocations
+# are in-process (see RevocationList): with several workers, a token revoked on
+# one worker is accepted by the others until it expires after this lifetime
+TOKEN_LIFETIME = timedelta(hours=int(os.getenv("JWT_TOKEN_LIFETIME_HOURS", "24")))
+
+
+def create_user_token(user):
+    """
+    Create an access token for a user.
+
+    The role and id of the user are signed into the token as the ``role`` and
+    ``uid`` claims, so role checks and user id lookups do not need the database.
+
+    :param user: The User the token is issued for.
+    :return: The encoded access token.
+    """
+    return create_access_token(
+        identity=user.username,
+        additional_claims={"role": user.role, "uid": user.id},
+        expires_delta=TOKEN_LIFETIME,
+    )
+
+
+class RevocationList:
+    """
+    In-memory denylist of users whose tokens issued before a given time must be
+    rejected, e.g. because the user was deleted or changed role.
+
+    One entry is kept per user rather than per token, and entries expire once
+    every token they could match has expired on its own (``ttl`` seconds), so
+    the list stays as small as the number of recent revocations. The list is
+    per process: with several workers a revocation only reaches the worker that
+    handled it, and the other workers accept the revoked tokens until they
+    expire (:data:`TOKEN_LIFETIME`).
+    """
+
+    def __init__(self, ttl=TOKEN_LIFETIME.total_seconds()):
+        self.ttl = ttl
+        self._revoked = {}  # username -> revocation time
+        self._lock = threading.Lock()
+
+    def revoke(self, username):
+        """Reject all tokens of ``username`` issued up to the current second."""
+        now = int(time.time())
+        with self._lock:
+            self._revoked[username] = now
+            self._purge(now)
+
+    def is_revoked(self, username, issued_at):
+        """
+        :param issued_at: The ``iat`` claim of the token. It has whole-second
+                          precision, so tokens issued in the second of the
+                          revocation are rejected too, even those of a new
+                          account reusing the username, whose owner logs in again.
+        :return: True if the token was issued no later than the second ``username`` was revoked in.
+        """
+        revoked_at = self._revoked.get(username)
+        if revoked_at is None or time.time() - revoked_at > self.ttl:
+            return False
+        return issued_at <= revoked_at
+
+    def clear(self):
+        with self._lock:
+            self._revoked.clear()
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def _purge(self, now):
+        expired = [username for username, revoked_at in self._revoked.items() if now - revoked_at > self.ttl]
+        for username in expired:
+            del self._revoked[username]
+
+
+revocation_list = RevocationList()
+
+
+def is_token_revoked(jwt_header, jwt_payload):
+    """Token blocklist callback for ``JWTManager.token_in_blocklist_loader``."""
+    return revocation_list.is_revoked(jwt_payload["sub"], jwt_payload.get("iat", 0))
+
+
+def get_current_user():
+    """
+    Return the user identified by the JWT of the current request.
+
+    The user is loaded at most once per request and cached on ``flask.g``, so the
+    role check and the route handler share a single database lookup.
+
+    :return: The User instance, or None if the user no longer exists.
+    """
+    if "current_user" not in g:
+        g.current_user = User.query.filter_by(username=get_jwt_identity()).first()
+    return g.current_user
+
+
+def get_current_role():
+    """
+    Return the role of the user identified by the JWT of the current request,
+    read from the token's ``role`` claim. Tokens issued without claims fall
+    back to loading the user.
+
+    :return: The role, or None if the user no longer exists.
+    """
+    claims = get_jwt()
+    if "role" in claims:
+        return claims["role"]
+    user = get_current_user()
+    return user.role if user else None
+
+
+def get_current_user_id():
+    """
+    Return the id of the user identified by the JWT of the current request,
+    read from the token's ``uid`` claim. Tokens issued without claims fall
+    back to loading the user.
+
+    :return: The user id, or None if the user no longer exists.
+    """
+    claims = get_jwt()
+    if "uid" in claims:
+        return claims["uid"]
+    user = get_current_user()
+    return user.id if user else None
+
+
+def require_role(role):
+    """
+    Decorator restricting a route to users with the given role.
+    Must be applied below ``@jwt_required()``.
+
+    :param role: The role required for the operation (e.g., 'customer' or 'admin').
+    :return: The decorated route, which responds with 403 if access is forbidden.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if get_current_role() != role:
+                return jsonify({"error": "Access forbidden"}), 403
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -11,6 +11,7 @@ class User(db.Model):
     address = db.Column(db.String(255), nullable=True)
     gender = db.Column(db.String(50), nullable=True)
     marital_status = db.Column(db.String(50), nullable=True)
+    # Opening balance; the current balance is kept by the wallet ledger (services/customers/wallet.py)
     wallet_balance = db.Column(db.Float, nullable=False, default=0.0)
     role = db.Column(db.String(50), nullable=False, default='customer')  # Role: 'customer' or 'admin'
 
@@ -26,3 +27,36 @@ class User(db.Model):
             "wallet_balance": self.wallet_balance,
             "role": self.role
         }
+
+
+class WalletEntry(db.Model):
+    """
+    Append-only record of one wallet credit (positive) or debit (negative).
+    Entries are never updated, and only deleted together with their user.
+    """
+    __tablename__ = 'wallet_entries'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'charge', 'deduct' or 'sale'
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    # Entries of a user newer than their snapshot
+    __table_args__ = (
+        db.Index('ix_wallet_entries_user_id', 'user_id', 'id'),
+        db.Index('ix_wallet_entries_created_at', 'created_at'),
+    )
+
+
+class WalletSnapshot(db.Model):
+    """
+    Balance of a user's wallet including all entries up to ``last_entry_id``.
+    Users without a snapshot start from ``User.wallet_balance``.
+    """
+    __tablename__ = 'wallet_snapshots'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    balance_cents = db.Column(db.BigInteger, nullable=False)
+    last_entry_id = db.Column(db.BigInteger, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import bcrypt
+import metrics
+
+# bcrypt releases the GIL while hashing, so a thread pool uses all cores
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(os.cpu_count() or 2)))
+# Password operations allowed to wait for a worker before new ones are rejected
+PASSWORD_POOL_QUEUE = int(os.getenv("PASSWORD_POOL_QUEUE", str(PASSWORD_POOL_WORKERS * 4)))
+# Longest a request waits for its password operation, in seconds
+PASSWORD_POOL_TIMEOUT = float(os.getenv("PASSWORD_POOL_TIMEOUT", "5"))
+# Retry-After sent with 503 responses while the pool is saturated, in seconds
+PASSWORD_RETRY_AFTER = int(os.getenv("PASSWORD_RETRY_AFTER", "1"))
+
+POOL_SIZE = metrics.gauge("password_pool_workers", "Threads hashing and verifying passwords.").labels()
+QUEUE_DEPTH = metrics.gauge("password_pool_queue_depth", "Password operations waiting for a worker.").labels()
+WAIT_TIME = metrics.histogram("password_pool_wait_seconds", "Time password operations waited for a worker.")
+RUN_TIME = metrics.histogram("password_pool_run_seconds", "Time spent hashing or verifying a password.")
+REJECTED = metrics.counter(
+    "password_pool_rejected_total", "Password operations rejected because the pool was saturated or too slow.",
+    ("reason",),
+)
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when a password operation cannot be run in time; answer with 503."""
+
+    def __init__(self, message, retry_after=PASSWORD_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PasswordPool:
+    """
+    Bounded pool running bcrypt off the request threads.
+
+    At most ``workers`` operations run at a time and at most ``queue_size``
+    more wait for a worker. Beyond that :meth:`run` fails immediately with
+    :class:`PasswordPoolBusy` instead of queueing, so a login burst cannot pin
+    every request thread and the caller can answer with a fast 503.
+    """
+
+    def __init__(self, workers=PASSWORD_POOL_WORKERS, queue_size=PASSWORD_POOL_QUEUE,
+                 timeout=PASSWORD_POOL_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        POOL_SIZE.set(workers)
+
+    def run(self, func, *args):
+        """
+        Run ``func(*args)`` on the pool and return its result.
+
+        :raises PasswordPoolBusy: If the pool is saturated or the result is not
+                                  ready within ``timeout`` seconds.
+        """
+        if not self._slots.acquire(blocking=False):
+            REJECTED.labels("saturated").inc()
+            raise PasswordPoolBusy("Too many password operations in progress, try again later")
+        QUEUE_DEPTH.inc()
+        future = self._executor.submit(self._call, time.perf_counter(), func, args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # The operation still runs to completion and frees its slot then
+            REJECTED.labels("timeout").inc()
+            raise PasswordPoolBusy("Password operation timed out, try again later")
+
+    def _call(self, submitted, func, args):
+        started = time.perf_counter()
+        QUEUE_DEPTH.dec()
+        WAIT_TIME.labels().observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            RUN_TIME.labels().observe(time.perf_counter() - started)
+            self._slots.release()
+
+
+password_pool = PasswordPool()
+
+
+def hash_password(password):
+    """
+    Hash a password with bcrypt on the password pool.
+
+    :param password: The plain text password.
+    :return: The bcrypt hash as a string.
+    :raises PasswordPoolBusy: If the pool is saturated.
+    """
+    hashed = password_pool.run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt())
+    return hashed.decode('utf-8')
+
+
+def check_password(password, hashed):
+    """
+    Verify a password against its bcrypt hash on the password pool.
+
+    :param password: The plain text password.
+    :param hashed: The stored bcrypt hash.
+    :return: True if the password matches.
+    :raises PasswordPoolBusy: If the pool is saturated.
+    """
+    return password_pool.run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
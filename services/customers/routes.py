@@ -1,27 +1,15 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, json, request, jsonify, stream_with_context
 from .models import User
+from .auth import create_user_token, get_current_user, get_current_user_id, require_role, revocation_list
+from . import wallet
 from database.db_config import db
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from datetime import timedelta
+from database.pagination import NEXT_CURSOR_HEADER, iter_keyset, keyset_page, page_args
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from utils import profile_route, line_profile, memory_profile
-import bcrypt
+from .passwords import PasswordPoolBusy, check_password, hash_password
 
 user_bp = Blueprint('user', __name__)
 
-# Helper function to check the role
-def check_role(expected_role):
-    """
-    Helper function to check if the currently logged-in user has the expected role.
-
-    :param expected_role: The role required for the operation (e.g., 'customer' or 'admin').
-    :return: A JSON response with an error message if access is forbidden, otherwise None.
-    """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-    if not user or user.role != expected_role:
-        return jsonify({"error": "Access forbidden"}), 403
-    return None
-
 @user_bp.route('/register', methods=['POST'])
 @profile_route
 @memory_profile
@@ -47,11 +35,11 @@ def register_customer():
         if User.query.filter_by(username=data['username']).first():
             return jsonify({"error": "Username already exists"}), 400
 
-        hashed_password = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+        hashed_password = hash_password(data['password'])
         new_customer = User(
             full_name=data['full_name'],
             username=data['username'],
-            password=hashed_password.decode('utf-8'),
+            password=hashed_password,
             age=data['age'],
             address=data['address'],
             gender=data['gender'],
@@ -62,9 +50,12 @@ def register_customer():
         db.session.add(new_customer)
         db.session.commit()
         
-        access_token = create_access_token(identity=data['username'], expires_delta=timedelta(hours=24))
+        access_token = create_user_token(new_customer)
 
         return jsonify({"message": "User registered successfully","token": access_token}), 201
+    except PasswordPoolBusy as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -93,18 +84,21 @@ def login_customer():
             return jsonify({"error": "Invalid username or password"}), 401
 
         # Check password
-        if not bcrypt.checkpw(password.encode('utf-8'), customer.password.encode('utf-8')):
+        if not check_password(password, customer.password):
             return jsonify({"error": "Invalid username or password"}), 401
 
-        # Generate JWT Token
-        access_token = create_access_token(identity=username, expires_delta=timedelta(hours=24))
+        # Generate JWT Token carrying the role and id of the user
+        access_token = create_user_token(customer)
 
         return jsonify({"message": "Login successful", "token": access_token}), 200
+    except PasswordPoolBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route('/delete', methods=['DELETE'])
 @jwt_required()
+@require_role('customer')  # Only customers can delete themselves
 @profile_route
 @memory_profile
 def delete_customer():
@@ -113,22 +107,19 @@ def delete_customer():
 
     :return: A JSON response with a success message or an error message.
     """
-    auth_error = check_role('customer')  # Only customers can delete themselves
-    if auth_error:
-        return auth_error
     try:
-        # Get the currently logged-in user's identity
         current_user = get_jwt_identity()
-
-        # Query the customer by username
-        customer = User.query.filter_by(username=current_user).first()
-
+        # The logged-in customer
+        customer = get_current_user()
         if not customer:
             return jsonify({"error": "Customer not found"}), 404
 
-        # Delete the customer
+        # Delete the customer with their wallet, which a new user could otherwise inherit with the id
+        wallet.delete_wallet(customer.id)
         db.session.delete(customer)
         db.session.commit()
+        # Tokens of the deleted customer still carry a valid role claim
+        revocation_list.revoke(current_user)
 
         return jsonify({"message": f"Customer {current_user} deleted successfully"}), 200
     except Exception as e:
@@ -137,6 +128,7 @@ def delete_customer():
 
 @user_bp.route('/update', methods=['PATCH'])
 @jwt_required()
+@require_role('customer')
 @profile_route
 @memory_profile
 def update_customer():
@@ -153,17 +145,9 @@ def update_customer():
     }
     :return: A JSON response with a success message or an error message.
     """
-    auth_error = check_role('customer')  
-    if auth_error:
-        return auth_error
-    
     try:
-        # Get the currently logged-in user's identity
-        current_user = get_jwt_identity()
-
-        # Query the customer by username
-        customer = User.query.filter_by(username=current_user).first()
-
+        # The logged-in customer
+        customer = get_current_user()
         if not customer:
             return jsonify({"error": "Customer not found"}), 404
 
@@ -172,8 +156,7 @@ def update_customer():
         if "full_name" in data:
             customer.full_name = data["full_name"]
         if "password" in data:
-            hashed_password = bcrypt.hashpw(data["password"].encode('utf-8'), bcrypt.gensalt())
-            customer.password = hashed_password.decode('utf-8')
+            customer.password = hash_password(data["password"])
         if "age" in data:
             customer.age = data["age"]
         if "address" in data:
@@ -186,39 +169,63 @@ def update_customer():
         # Save changes
         db.session.commit()
         return jsonify({"message": "Customer updated successfully"}), 200
+    except PasswordPoolBusy as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+# Columns returned by the customer listing; the password hash is never loaded
+CUSTOMER_COLUMNS = (
+    User.id, User.full_name, User.username, User.age, User.address,
+    User.gender, User.marital_status,
+    wallet.balance_cents_expression(User.id, User.wallet_balance).label("wallet_balance"),
+)
+
+
+def _customer_row(row):
+    """Serialize a row of CUSTOMER_COLUMNS."""
+    result = row._asdict()
+    result["wallet_balance"] = wallet.from_cents(row.wallet_balance)
+    return result
+
+
 @user_bp.route('/', methods=['GET'])
 @line_profile
 @memory_profile
 def get_all_customers():
     """
-    Retrieve a list of all customers.
+    Retrieve a page of customers ordered by ID.
 
+    :query limit: Maximum number of customers to return (default 50, at most 500).
+    :query after: ID of the last customer of the previous page.
+    :query export: If "true", stream all customers as one JSON array instead of a page.
     :return: A JSON response with a list of customer details or an error message.
+             The ``X-Next-Cursor`` header holds the ``after`` value of the next
+             page and is missing on the last page.
     """
     try:
-        # Query all users
-        users = User.query.all()
-
-        # Serialize the result
-        result = [
-            {
-                "id": user.id,
-                "full_name": user.full_name,
-                "username": user.username,
-                "age": user.age,
-                "address": user.address,
-                "gender": user.gender,
-                "marital_status": user.marital_status,
-                "wallet_balance": float(user.wallet_balance),
-            }
-            for user in users
-        ]
-
-        return jsonify(result), 200
+        query = User.query.with_entities(*CUSTOMER_COLUMNS)
+
+        if request.args.get('export') == 'true':
+            # Fetched in keyset batches, so memory stays flat for any table size
+            def generate():
+                yield "["
+                for index, row in enumerate(iter_keyset(query, User.id)):
+                    yield ("," if index else "") + json.dumps(_customer_row(row))
+                yield "]"
+            return Response(stream_with_context(generate()), mimetype='application/json')
+
+        limit, after = page_args()
+        rows, next_cursor = keyset_page(query, User.id, limit, after)
+
+        response = jsonify([_customer_row(row) for row in rows])
+        if next_cursor is not None:
+            response.headers[NEXT_CURSOR_HEADER] = str(next_cursor)
+        return response, 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -234,29 +241,18 @@ def get_customer_by_id(customer_id):
     """
     try:
         # Query the customer by ID
-        user = User.query.get(customer_id)
+        user = User.query.with_entities(*CUSTOMER_COLUMNS).filter(User.id == customer_id).first()
 
         if not user:
             return jsonify({"error": "Customer not found"}), 404
 
-        # Serialize the result
-        result = {
-            "id": user.id,
-            "full_name": user.full_name,
-            "username": user.username,
-            "age": user.age,
-            "address": user.address,
-            "gender": user.gender,
-            "marital_status": user.marital_status,
-            "wallet_balance": float(user.wallet_balance),
-        }
-
-        return jsonify(result), 200
+        return jsonify(_customer_row(user)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route('/wallet/charge', methods=['POST'])
 @jwt_required()
+@require_role('customer')
 @line_profile
 @memory_profile
 def charge_wallet():
@@ -266,17 +262,10 @@ def charge_wallet():
     :request json: {"amount": "Amount to add"}
     :return: A JSON response with the updated wallet balance or an error message.
     """
-    auth_error = check_role('customer')  
-    if auth_error:
-        return auth_error
     try:
-        # Get the currently logged-in user's identity
-        current_user = get_jwt_identity()
-
-        # Query the customer by username
-        customer = User.query.filter_by(username=current_user).first()
-
-        if not customer:
+        # The logged-in customer
+        customer_id = get_current_user_id()
+        if customer_id is None:
             return jsonify({"error": "Customer not found"}), 404
 
         # Get the amount to charge from the request
@@ -286,18 +275,22 @@ def charge_wallet():
         if not amount or amount <= 0:
             return jsonify({"error": "Invalid amount"}), 400
 
-        # Update wallet balance
-        customer.wallet_balance += amount
+        # Append to the wallet ledger; concurrent top-ups do not lock the user
+        wallet.credit(customer_id, wallet.to_cents(amount), "charge")
         db.session.commit()
 
         return jsonify({"message": f"${amount} successfully added to wallet", 
-                        "wallet_balance": float(customer.wallet_balance)}), 200
+                        "wallet_balance": wallet.from_cents(wallet.get_balance(customer_id))}), 200
+    except wallet.UnknownUser:
+        db.session.rollback()
+        return jsonify({"error": "Customer not found"}), 404
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route('/wallet/deduct', methods=['POST'])
 @jwt_required()
+@require_role('customer')
 @memory_profile
 def deduct_wallet():
     """
@@ -306,19 +299,7 @@ def deduct_wallet():
     :request json: {"amount": "Amount to deduct"}
     :return: A JSON response with the updated wallet balance or an error message.
     """
-    auth_error = check_role('customer')  
-    if auth_error:
-        return auth_error
     try:
-        # Get the currently logged-in user's identity
-        current_user = get_jwt_identity()
-
-        # Query the customer by username
-        customer = User.query.filter_by(username=current_user).first()
-
-        if not customer:
-            return jsonify({"error": "Customer not found"}), 404
-
         # Get the amount to deduct from the request
         data = request.json
         amount = data.get("amount")
@@ -326,15 +307,17 @@ def deduct_wallet():
         if not amount or amount <= 0:
             return jsonify({"error": "Invalid amount"}), 400
 
-        if customer.wallet_balance < amount:
-            return jsonify({"error": "Insufficient funds"}), 400
-
-        # Deduct amount from wallet balance
-        customer.wallet_balance -= amount
+        _, balance = wallet.debit(get_jwt_identity(), wallet.to_cents(amount), "deduct")
         db.session.commit()
 
         return jsonify({"message": f"${amount} successfully deducted from wallet", 
-                        "wallet_balance": float(customer.wallet_balance)}), 200
+                        "wallet_balance": wallet.from_cents(balance)}), 200
+    except wallet.UnknownUser:
+        db.session.rollback()
+        return jsonify({"error": "Customer not found"}), 404
+    except wallet.InsufficientFunds:
+        db.session.rollback()
+        return jsonify({"error": "Insufficient funds"}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import BigInteger, DateTime, String, cast, delete, func, insert, literal, update
+from sqlalchemy.exc import IntegrityError
+from database.db_config import db
+from .models import User, WalletEntry, WalletSnapshot
+
+# Seconds between two background compactions; 0 disables the compactor
+WALLET_COMPACT_INTERVAL = float(os.getenv("WALLET_COMPACT_INTERVAL", "60"))
+# Entries younger than this are never folded into a snapshot. It must exceed the
+# longest transaction, so a snapshot never skips an entry committed out of id order
+WALLET_COMPACT_LAG = float(os.getenv("WALLET_COMPACT_LAG", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class WalletError(Exception):
+    """Base class of the errors raised by wallet operations."""
+
+
+class UnknownUser(WalletError):
+    """The wallet owner does not exist."""
+
+
+class InsufficientFunds(WalletError):
+    """The wallet balance does not cover a debit."""
+
+
+def to_cents(amount):
+    """Convert an amount in dollars, as sent by clients, to integer cents."""
+    return int(round(amount * 100))
+
+
+def from_cents(cents):
+    """Convert integer cents to dollars for responses."""
+    return int(cents) / 100
+
+
+def _opening_cents(opening_balance):
+    return cast(func.round(opening_balance * 100), BigInteger)
+
+
+def balance_cents_expression(user_id, opening_balance):
+    """
+    SQL expression computing the balance of a wallet in cents: the snapshot, or
+    the opening balance when there is none, plus the entries newer than the
+    snapshot. Compaction keeps that tail short, so this is two primary key
+    lookups and a short index range scan.
+
+    :param user_id: Column or value holding the user id, e.g. ``User.id`` to
+                    correlate with a query on users.
+    :param opening_balance: Column holding the opening balance (``User.wallet_balance``).
+    """
+    snapshot = db.select(WalletSnapshot.balance_cents).where(WalletSnapshot.user_id == user_id).scalar_subquery()
+    watermark = db.select(WalletSnapshot.last_entry_id).where(WalletSnapshot.user_id == user_id).scalar_subquery()
+    tail = db.select(func.coalesce(func.sum(WalletEntry.amount_cents), 0)).where(
+        WalletEntry.user_id == user_id, WalletEntry.id > func.coalesce(watermark, 0)
+    ).scalar_subquery()
+    return func.coalesce(snapshot, _opening_cents(opening_balance)) + tail
+
+
+def get_balance(user_id):
+    """
+    Return the current balance of a wallet in cents, or None if the user does not exist.
+    """
+    balance = db.session.execute(
+        db.select(balance_cents_expression(User.id, User.wallet_balance)).where(User.id == user_id)
+    ).scalar()
+    return None if balance is None else int(balance)
+
+
+def credit(user_id, cents, kind):
+    """
+    Add funds to a wallet.
+
+    A credit only appends an entry: it takes no lock on the snapshot and no
+    exclusive lock on the user, so concurrent top-ups never wait for each
+    other. The entry is selected from the user row, so none is written for a
+    user that does not exist (or is being deleted).
+
+    :param user_id: ID of the wallet owner.
+    :param cents: Positive amount to add.
+    :param kind: What the entry is for, e.g. 'charge'.
+    :raises UnknownUser: If the user does not exist.
+    """
+    inserted = db.session.execute(insert(WalletEntry).from_select(
+        ["user_id", "amount_cents", "kind", "created_at"],
+        db.select(User.id, literal(cents, BigInteger), literal(kind, String), literal(datetime.utcnow(), DateTime))
+        .where(User.id == user_id),
+    )).rowcount
+    if not inserted:
+        raise UnknownUser(user_id)
+
+
+def debit(username, cents, kind):
+    """
+    Take funds from a wallet if the balance covers them.
+
+    Debits of one user are serialized by locking their user row; the entries
+    newer than the snapshot are summed with a locking read, so the check sees
+    every committed debit even if the transaction started earlier. The caller
+    commits the transaction, or rolls it back on error.
+
+    :param username: Username of the wallet owner.
+    :param cents: Positive amount to take.
+    :param kind: What the entry is for, e.g. 'deduct' or 'sale'.
+    :return: A tuple (user_id, balance_cents) with the balance after the debit.
+    :raises UnknownUser: If the user does not exist.
+    :raises InsufficientFunds: If the balance is lower than ``cents``.
+    """
+    account = db.session.execute(
+        db.select(User.id, User.wallet_balance, WalletSnapshot.balance_cents, WalletSnapshot.last_entry_id)
+        .outerjoin(WalletSnapshot, WalletSnapshot.user_id == User.id)
+        .where(User.username == username)
+        .with_for_update()
+    ).first()
+    if account is None:
+        raise UnknownUser(username)
+
+    if account.balance_cents is None:
+        balance, watermark = to_cents(account.wallet_balance), 0
+    else:
+        balance, watermark = account.balance_cents, account.last_entry_id
+    balance += int(db.session.execute(
+        db.select(func.coalesce(func.sum(WalletEntry.amount_cents), 0))
+        .where(WalletEntry.user_id == account.id, WalletEntry.id > watermark)
+        .with_for_update(read=True)
+    ).scalar())
+    if balance < cents:
+        raise InsufficientFunds(username)
+
+    db.session.execute(insert(WalletEntry).values(
+        user_id=account.id, amount_cents=-cents, kind=kind, created_at=datetime.utcnow()
+    ))
+    return account.id, balance - cents
+
+
+def delete_wallet(user_id):
+    """
+    Delete the ledger entries and snapshot of a user, in the caller's
+    transaction, which also deletes the user. Ids can be reused, and a new
+    account must not inherit the balance of a deleted one.
+
+    :param user_id: ID of the deleted user.
+    """
+    db.session.execute(delete(WalletEntry).where(WalletEntry.user_id == user_id))
+    db.session.execute(delete(WalletSnapshot).where(WalletSnapshot.user_id == user_id))
+
+
+def compact(lag=WALLET_COMPACT_LAG):
+    """
+    Fold the entries older than ``lag`` seconds into the snapshot of their user.
+
+    Entries are only deleted with their user, so a balance computed from an
+    older snapshot stays correct while a compaction commits. Each user is compacted in its
+    own short transaction, and a snapshot changed concurrently is skipped until
+    the next run.
+
+    :return: The number of wallets compacted.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lag)
+    pending = db.session.execute(
+        db.select(WalletEntry.user_id, func.max(WalletEntry.id))
+        .outerjoin(WalletSnapshot, WalletSnapshot.user_id == WalletEntry.user_id)
+        .where(WalletEntry.id > func.coalesce(WalletSnapshot.last_entry_id, 0), WalletEntry.created_at <= cutoff)
+        .group_by(WalletEntry.user_id)
+    ).all()
+    db.session.rollback()
+
+    compacted = 0
+    for user_id, upto in pending:
+        try:
+            compacted += _compact_wallet(user_id, upto)
+            db.session.commit()
+        except IntegrityError:
+            # Another compactor created the snapshot first
+            db.session.rollback()
+    return compacted
+
+
+def _compact_wallet(user_id, upto):
+    snapshot = db.session.execute(
+        db.select(WalletSnapshot.balance_cents, WalletSnapshot.last_entry_id).where(WalletSnapshot.user_id == user_id)
+    ).first()
+    watermark = snapshot.last_entry_id if snapshot else 0
+    folded = int(db.session.execute(
+        db.select(func.coalesce(func.sum(WalletEntry.amount_cents), 0))
+        .where(WalletEntry.user_id == user_id, WalletEntry.id > watermark, WalletEntry.id <= upto)
+    ).scalar())
+
+    if snapshot is not None:
+        result = db.session.execute(
+            update(WalletSnapshot)
+            .where(WalletSnapshot.user_id == user_id, WalletSnapshot.last_entry_id == watermark)
+            .values(balance_cents=WalletSnapshot.balance_cents + folded, last_entry_id=upto,
+                    updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    # Shared lock, so the user cannot be deleted (with their wallet) before the snapshot is written
+    opening = db.session.execute(
+        db.select(User.wallet_balance).where(User.id == user_id).with_for_update(read=True)
+    ).scalar()
+    if opening is None:
+        # Deleted user, whose wallet is being deleted too
+        return 0
+    db.session.execute(insert(WalletSnapshot).values(
+        user_id=user_id, balance_cents=to_cents(opening) + folded, last_entry_id=upto, updated_at=datetime.utcnow()
+    ))
+    return 1
+
+
+class WalletCompactor:
+    """Background thread running :func:`compact` every ``interval`` seconds."""
+
+    def __init__(self, interval=WALLET_COMPACT_INTERVAL, lag=WALLET_COMPACT_LAG):
+        self.interval = interval
+        self.lag = lag
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, app):
+        """Start the compactor for ``app`` if it is not running yet."""
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(app,), name="wallet-compactor", daemon=True)
+                self._thread.start()
+
+    def _run(self, app):
+        while True:
+            time.sleep(self.interval)
+            with app.app_context():
+                try:
+                    compact(self.lag)
+                except Exception:
+                    logger.exception("Wallet compaction failed")
+                finally:
+                    db.session.remove()
+
+
+wallet_compactor = WalletCompactor()
+
+
+def init_app(app):
+    """Start compacting wallet snapshots in the background with the first request (not in tests)."""
+    def start_compactor():
+        if not app.testing:
+            wallet_compactor.start(app)
+    app.before_request(start_compactor)
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import metrics
+from database.db_config import db
+from database.routing import use_primary
+from etags import VersionCounter
+from serialization import row_dicts
+from .models import INVENTORY_COLUMNS, Inventory
+
+# Seconds a cached catalog entry is served before it is reloaded
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "30"))
+# Most items kept in the per-item cache; the least recently used are evicted first
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "10000"))
+
+CACHE_REQUESTS = metrics.counter(
+    "catalog_cache_requests_total", "Catalog cache lookups, by cache and result (hit or miss).", ("cache", "result"),
+)
+CACHE_EVICTIONS = metrics.counter(
+    "catalog_cache_evictions_total", "Catalog cache entries dropped, by cache and reason (lru or ttl).",
+    ("cache", "reason"),
+)
+
+
+class TTLCache:
+    """
+    Thread-safe mapping whose entries expire ``ttl`` seconds after they were
+    stored and which evicts the least recently used entry beyond ``maxsize``.
+
+    Every invalidation bumps a generation counter. :meth:`get_or_load` only
+    stores a loaded value if no invalidation happened while it was loading, so
+    a reader racing with a writer cannot put data older than the write back.
+    """
+
+    def __init__(self, name, ttl=CATALOG_CACHE_TTL, maxsize=CATALOG_CACHE_SIZE):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._hits = CACHE_REQUESTS.labels(name, "hit")
+        self._misses = CACHE_REQUESTS.labels(name, "miss")
+        self._lru_evictions = CACHE_EVICTIONS.labels(name, "lru")
+        self._ttl_evictions = CACHE_EVICTIONS.labels(name, "ttl")
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value of ``key``, calling ``loader()`` to load and
+        store it on a miss. A loader returning None is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits.inc()
+                    return entry[1]
+                del self._entries[key]
+                self._ttl_evictions.inc()
+            generation = self._generation
+        self._misses.inc()
+
+        value = loader()
+        if value is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._store(key, value)
+        return value
+
+    def set(self, key, value):
+        """Store a fresh value written through by the owner of the data."""
+        with self._lock:
+            self._generation += 1
+            self._store(key, value)
+
+    def invalidate(self, *keys):
+        """Drop ``keys``, or every entry when no key is given."""
+        with self._lock:
+            self._generation += 1
+            if not keys:
+                self._entries.clear()
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._lru_evictions.inc()
+
+
+class CatalogCache:
+    """
+    In-process cache of the inventory: the full listing and one entry per item,
+    both holding ``Inventory.to_dict()`` results.
+
+    Routes that change inventory write updated items through with
+    :meth:`item_changed` (or drop them with :meth:`items_changed`) after their
+    commit; every change also bumps :attr:`versions`, the shared version the
+    catalog ETags are derived from. The listing is cached per version, so every
+    process reloads it after a change made anywhere; other processes are not
+    notified of item changes, so they serve stale items for at most ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl=CATALOG_CACHE_TTL, maxsize=CATALOG_CACHE_SIZE):
+        self.listing_cache = TTLCache("listing", ttl, maxsize=1)
+        self.item_cache = TTLCache("item", ttl, maxsize)
+        self.versions = VersionCounter("catalog")
+
+    def listing(self):
+        """Return all inventory items as dictionaries."""
+        def load():
+            # Cached entries outlive the request, so never fill them from a lagging replica
+            with use_primary():
+                return row_dicts(db.session.execute(db.select(*INVENTORY_COLUMNS)))
+        return self.listing_cache.get_or_load(self.versions.current(), load)
+
+    def item(self, item_id):
+        """Return one inventory item as a dictionary, or None if it does not exist."""
+        def load():
+            with use_primary():
+                item = db.session.execute(db.select(*INVENTORY_COLUMNS).where(Inventory.id == item_id)).first()
+            return item._asdict() if item else None
+        return self.item_cache.get_or_load(item_id, load)
+
+    def item_changed(self, item):
+        """Write a committed change of ``item`` through to the cache."""
+        self.item_cache.set(item.id, item.to_dict())
+        self.listing_cache.invalidate()
+        # Bumped last, so a reader seeing the new version also sees the new data
+        self.versions.bump()
+
+    def items_changed(self, *item_ids):
+        """Drop items changed without loading them, e.g. by a bulk UPDATE."""
+        if item_ids:
+            self.item_cache.invalidate(*item_ids)
+        self.listing_cache.invalidate()
+        self.versions.bump()
+
+    def clear(self):
+        self.item_cache.invalidate()
+        self.listing_cache.invalidate()
+
+
+catalog_cache = CatalogCache()
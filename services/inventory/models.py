@@ -10,6 +10,14 @@ class Inventory(db.Model):
     description = db.Column(db.String(255))  # Item description
     stock_count = db.Column(db.Integer, nullable=False, default=0)  # Available items in stock
 
+    # Catalog filters and sort keys, each ending with id for keyset pagination
+    __table_args__ = (
+        db.Index('ix_inventory_category_price', 'category', 'price_per_item', 'id'),
+        db.Index('ix_inventory_category_name', 'category', 'name', 'id'),
+        db.Index('ix_inventory_price', 'price_per_item', 'id'),
+        db.Index('ix_inventory_name', 'name', 'id'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -19,3 +27,10 @@ class Inventory(db.Model):
             "description": self.description,
             "stock_count": self.stock_count,
         }
+
+
+# Columns of Inventory.to_dict, to serialize rows without loading instances
+INVENTORY_COLUMNS = (
+    Inventory.id, Inventory.name, Inventory.category, Inventory.price_per_item,
+    Inventory.description, Inventory.stock_count,
+)
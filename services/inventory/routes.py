@@ -1,27 +1,22 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from database.db_config import db
-from .models import Inventory
+from .models import INVENTORY_COLUMNS, Inventory
+from .cache import catalog_cache
+from .search import search_index
+from database.pagination import NEXT_CURSOR_HEADER, limit_arg, seek_page
+from database.projection import fields_arg, pick, with_columns
+from database.routing import use_replica
 from utils import line_profile, profile_route, memory_profile
-from services.customers.models import User
+from etags import conditional
+from serialization import row_dicts
+from services.customers.auth import require_role
 
 inventory_bp = Blueprint('inventory', __name__)
 
-# Helper function to check admin role
-def authorize_admin():
-    """
-    Helper function to check if the currently logged-in user has admin privileges.
-
-    :return: A JSON response with an error message if access is forbidden, otherwise None.
-    """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-    if not user or user.role != 'admin':
-        return jsonify({"error": "Access forbidden"}), 403
-    return None
-
 @inventory_bp.route('/add', methods=['POST'])
 @jwt_required()
+@require_role('admin')  # Only admins can add inventory
 @profile_route
 @memory_profile
 def add_inventory_item():
@@ -37,10 +32,6 @@ def add_inventory_item():
     }
     :return: A JSON response with a success message or an error message.
     """
-    auth_error = authorize_admin()  # Only admins can add inventory
-    if auth_error:
-        return auth_error
-
     try:
         data = request.json
         new_item = Inventory(
@@ -52,6 +43,8 @@ def add_inventory_item():
         )
         db.session.add(new_item)
         db.session.commit()
+        catalog_cache.item_changed(new_item)
+        search_index.item_changed(new_item)
 
         return jsonify({"message": "Item added successfully"}), 201
     except Exception as e:
@@ -60,6 +53,7 @@ def add_inventory_item():
 
 @inventory_bp.route('/<int:item_id>/deduct', methods=['POST'])
 @jwt_required()
+@require_role('admin')
 @line_profile
 @memory_profile
 def deduct_stock(item_id):
@@ -72,10 +66,6 @@ def deduct_stock(item_id):
     }
     :return: A JSON response with a success message and remaining stock, or an error message.
     """
-    auth_error = authorize_admin()
-    if auth_error:
-        return auth_error
-
     try:
         # Get the item by ID
         item = Inventory.query.get(item_id)
@@ -94,6 +84,7 @@ def deduct_stock(item_id):
         # Deduct the stock
         item.stock_count -= quantity
         db.session.commit()
+        catalog_cache.item_changed(item)
 
         return jsonify({
             "message": f"{quantity} units deducted from {item.name}",
@@ -105,6 +96,7 @@ def deduct_stock(item_id):
     
 @inventory_bp.route('/<int:item_id>/update', methods=['PATCH'])
 @jwt_required()
+@require_role('admin')
 @line_profile
 @memory_profile
 def update_item(item_id):
@@ -121,10 +113,6 @@ def update_item(item_id):
     }
     :return: A JSON response with a success message and updated item details, or an error message.
     """
-    auth_error = authorize_admin()
-    if auth_error:
-        return auth_error
-
     try:
         # Get the item by ID
         item = Inventory.query.get(item_id)
@@ -145,6 +133,8 @@ def update_item(item_id):
             item.stock_count = data['stock_count']
 
         db.session.commit()
+        catalog_cache.item_changed(item)
+        search_index.item_changed(item)
 
         return jsonify({"message": f"Item {item.name} updated successfully", "item": item.to_dict()}), 200
     except Exception as e:
@@ -155,20 +145,131 @@ def update_item(item_id):
 @jwt_required()
 @profile_route
 @memory_profile
+@conditional(catalog_cache.versions)
 def get_all_items():
     """
     Retrieve all inventory items.
 
+    :query fields: Comma-separated fields to return (default: all).
     :return: A JSON response with a list of inventory items, or an error message.
     """
     try:
-        # Query all items from the inventory
-        items = Inventory.query.all()
+        fields = fields_arg(INVENTORY_COLUMNS)
+        # Served from the catalog cache, already serialized to dictionaries
+        items = catalog_cache.listing()
+        return jsonify(items if len(fields) == len(INVENTORY_COLUMNS) else pick(items, fields)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Sort keys of the catalog; each ends with the primary key to make it unique
+CATALOG_SORT_KEYS = {
+    'id': (Inventory.id,),
+    'price': (Inventory.price_per_item, Inventory.id),
+    'name': (Inventory.name, Inventory.id),
+}
+
+
+def _float_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+@inventory_bp.route('/catalog', methods=['GET'])
+@use_replica
+@profile_route
+@memory_profile
+def get_catalog():
+    """
+    Retrieve a page of the catalog, optionally filtered and sorted.
 
-        # Serialize the results into a list of dictionaries
-        result = [item.to_dict() for item in items]
+    :query category: Only items of this category.
+    :query min_price: Only items costing at least this much.
+    :query max_price: Only items costing at most this much.
+    :query in_stock: If "true", only items with stock left.
+    :query sort: One of "id" (default), "price" or "name"; prefix with "-" for descending order.
+    :query limit: Maximum number of items to return (default 50, at most 500).
+    :query cursor: The ``X-Next-Cursor`` header of the previous page.
+    :query fields: Comma-separated fields to return (default: all).
+    :return: A JSON response with a list of inventory items, or an error message.
+             The ``X-Next-Cursor`` header is missing on the last page.
+    """
+    try:
+        sort = request.args.get('sort', 'id')
+        descending = sort.startswith('-')
+        columns = CATALOG_SORT_KEYS.get(sort.lstrip('-'))
+        if columns is None:
+            return jsonify({"error": f"sort must be one of {', '.join(CATALOG_SORT_KEYS)}"}), 400
+
+        # Only the requested columns are read, plus the sort key for the cursor
+        fields = fields_arg(INVENTORY_COLUMNS)
+        query = db.session.query(*with_columns(fields, columns))
+        category = request.args.get('category')
+        if category is not None:
+            query = query.filter(Inventory.category == category)
+        min_price = _float_arg('min_price')
+        if min_price is not None:
+            query = query.filter(Inventory.price_per_item >= min_price)
+        max_price = _float_arg('max_price')
+        if max_price is not None:
+            query = query.filter(Inventory.price_per_item <= max_price)
+        if request.args.get('in_stock') == 'true':
+            query = query.filter(Inventory.stock_count > 0)
+
+        items, next_cursor = seek_page(query, columns, limit_arg(), request.args.get('cursor'), descending)
+
+        response = jsonify(row_dicts(items, [column.key for column in fields]))
+        if next_cursor is not None:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return response, 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@inventory_bp.route('/search', methods=['GET'])
+@use_replica
+@profile_route
+@memory_profile
+def search_items():
+    """
+    Search the inventory by name, category and description, best matches first.
+
+    Every word of the query also matches the words it starts with, e.g. "head"
+    matches "headphones".
+
+    :query q: The words to search for.
+    :query limit: Maximum number of items to return (default 50, at most 500).
+    :query fields: Comma-separated fields to return (default: all).
+    :return: A JSON response with a list of inventory items, or an error message.
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({"error": "q is required"}), 400
+        fields = fields_arg(INVENTORY_COLUMNS)
+        limit = limit_arg()
 
-        return jsonify(result), 200
+        search_index.ensure_built()
+        ranked = [item_id for item_id, score in search_index.search(query, limit)]
+        if not ranked:
+            return jsonify([]), 200
+        rows = db.session.execute(
+            db.select(*with_columns(fields, (Inventory.id,))).where(Inventory.id.in_(ranked))
+        ).all()
+        position = {item_id: index for index, item_id in enumerate(ranked)}
+        rows.sort(key=lambda row: position[row.id])
+        return jsonify(row_dicts(rows, [column.key for column in fields])), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,259 @@
+import bisect
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+import metrics
+from database.db_config import db
+from database.routing import use_primary
+from .models import Inventory
+
+logger = logging.getLogger(__name__)
+
+# Seconds between rebuilds of the index from the database, which pick up changes
+# made by other processes; 0 disables the background rebuilds
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+# Indexed fields, and how many times each occurrence of a word in them counts
+FIELD_WEIGHTS = {"name": 3, "category": 2, "description": 1}
+# BM25 term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# A query word also matches the words it is a prefix of, at this fraction of the
+# score of a whole-word match and for at most MAX_PREFIX_TERMS words
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_TERMS = 50
+
+TOKEN = re.compile(r"\w+")
+
+SEARCH_LATENCY = metrics.histogram(
+    "search_query_seconds", "Time to rank the inventory items matching a search query.",
+).labels()
+INDEX_DOCUMENTS = metrics.gauge("search_index_documents", "Inventory items in the search index.").labels()
+
+
+def tokenize(text):
+    """Split ``text`` into lowercase words."""
+    return TOKEN.findall(text.casefold()) if text else []
+
+
+def _weighted_terms(fields):
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(fields.get(field)):
+            terms[token] += weight
+    return terms
+
+
+class _IndexData:
+    """Postings and statistics of one build of the index; guarded by the lock of its :class:`SearchIndex`."""
+
+    def __init__(self, items=()):
+        self.postings = {}  # term -> {item_id: weighted term frequency}
+        self.documents = {}  # item_id -> Counter of its terms
+        self.lengths = {}  # item_id -> weighted number of terms
+        self.total_length = 0
+        for item_id, fields in items:
+            self._index(item_id, fields)
+        # Sorted vocabulary, for prefix lookups; sorted once here, kept sorted by add()
+        self.terms = sorted(self.postings)
+
+    def add(self, item_id, fields):
+        self.remove(item_id)
+        for term in self._index(item_id, fields):
+            bisect.insort(self.terms, term)
+
+    def remove(self, item_id):
+        terms = self.documents.pop(item_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.lengths.pop(item_id)
+        for term in terms:
+            postings = self.postings[term]
+            del postings[item_id]
+            if not postings:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def _index(self, item_id, fields):
+        # Returns the terms new to the vocabulary
+        terms = _weighted_terms(fields)
+        self.documents[item_id] = terms
+        self.lengths[item_id] = sum(terms.values())
+        self.total_length += self.lengths[item_id]
+        new_terms = []
+        for term, frequency in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                new_terms.append(term)
+            postings[item_id] = frequency
+        return new_terms
+
+    def matches(self, word):
+        # The word itself, then the indexed words it is a prefix of
+        matches = [(word, 1.0)] if word in self.postings else []
+        expansions = 0
+        index = bisect.bisect_left(self.terms, word)
+        while index < len(self.terms) and expansions < MAX_PREFIX_TERMS:
+            term = self.terms[index]
+            if not term.startswith(word):
+                break
+            if term != word:
+                matches.append((term, PREFIX_WEIGHT))
+                expansions += 1
+            index += 1
+        return matches
+
+    def rank(self, words, limit):
+        count = len(self.lengths)
+        if not count or not words:
+            return []
+        average_length = self.total_length / count or 1.0
+        scores = Counter()
+        for word in words:
+            # A word matching several terms of an item counts once, by its best match
+            best = {}
+            for term, weight in self.matches(word):
+                postings = self.postings[term]
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for item_id, frequency in postings.items():
+                    norm = 1 - BM25_B + BM25_B * self.lengths[item_id] / average_length
+                    score = weight * idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+                    if score > best.get(item_id, 0.0):
+                        best[item_id] = score
+            scores.update(best)
+        # Equal scores keep the oldest item first
+        return heapq.nlargest(limit, scores.items(), key=lambda entry: (entry[1], -entry[0]))
+
+
+class SearchIndex:
+    """
+    In-process inverted index of the inventory names, categories and
+    descriptions, ranked with BM25.
+
+    Routes that add or update items index them with :meth:`item_changed` after
+    their commit. Other processes are not notified; a background thread
+    (:meth:`start`) rebuilds the index from the database every ``ttl`` seconds.
+    A rebuild reads and indexes the table without the lock, so searches keep
+    using the previous index until the new one is swapped in.
+    """
+
+    def __init__(self, ttl=SEARCH_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._data = _IndexData()
+        self._built = False
+        # Changes made while a rebuild reads the table, applied on top of what it read
+        self._pending = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self._built
+
+    def start(self, app):
+        """Rebuild the index for ``app`` now and every ``ttl`` seconds, in a background thread."""
+        if self._thread is not None or self.ttl <= 0:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(app,), name="search-indexer", daemon=True)
+                self._thread.start()
+
+    def ensure_built(self):
+        """Build the index if it was never built, e.g. before the background thread's first build finished."""
+        if self._built:
+            return
+        with self._build_lock:
+            if not self._built:
+                self._rebuild()
+
+    def rebuild(self):
+        """Index every inventory item again, from the primary."""
+        with self._build_lock:
+            self._rebuild()
+
+    def item_changed(self, item):
+        """Index a committed addition or change of ``item``."""
+        fields = {field: getattr(item, field) for field in FIELD_WEIGHTS}
+        with self._lock:
+            if self._pending is not None:
+                self._pending[item.id] = fields
+            self._data.add(item.id, fields)
+            INDEX_DOCUMENTS.set(len(self._data.lengths))
+
+    def clear(self):
+        """Drop the index, e.g. after the table was recreated; the next search builds it again."""
+        with self._lock:
+            self._data = _IndexData()
+            self._built = False
+            INDEX_DOCUMENTS.set(0)
+
+    def search(self, query, limit):
+        """
+        Rank the items matching any word of ``query``, whole or as a prefix.
+
+        :param query: Free text, e.g. "wireless head".
+        :param limit: Maximum number of results.
+        :return: A list of (item_id, score) pairs, best first.
+        """
+        start = time.perf_counter()
+        try:
+            words = list(dict.fromkeys(tokenize(query)))
+            with self._lock:
+                return self._data.rank(words, limit)
+        finally:
+            SEARCH_LATENCY.observe(time.perf_counter() - start)
+
+    def __len__(self):
+        return len(self._data.lengths)
+
+    def _rebuild(self):
+        with self._lock:
+            self._pending = {}
+        try:
+            with use_primary():
+                rows = db.session.execute(
+                    db.select(Inventory.id, *[getattr(Inventory, field) for field in FIELD_WEIGHTS])
+                ).all()
+            data = _IndexData((row.id, row._asdict()) for row in rows)
+            with self._lock:
+                for item_id, fields in self._pending.items():
+                    data.add(item_id, fields)
+                self._data = data
+                self._built = True
+                INDEX_DOCUMENTS.set(len(data.lengths))
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _run(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    self.rebuild()
+                except Exception:
+                    logger.exception("Search index rebuild failed")
+                finally:
+                    db.session.remove()
+            time.sleep(self.ttl)
+
+
+search_index = SearchIndex()
+
+
+def init_app(app):
+    """
+    Build and periodically rebuild the search index in the background, starting
+    with the first request (not in tests, which build it on their first search).
+    """
+    def start_indexer():
+        if not app.testing:
+            search_index.start(app)
+    app.before_request(start_indexer)
@@ -11,6 +11,15 @@ class Review(db.Model):
     timestamp = db.Column(db.DateTime, default=db.func.now())
     status = db.Column(db.String(50), nullable=False, default='pending')  # New field for moderation status
 
+    # Reviews of a product by status in each listing order (ending with id for keyset
+    # pagination), of a customer, and the moderation queue
+    __table_args__ = (
+        db.Index('ix_reviews_product_status_time', 'product_id', 'status', 'timestamp', 'id'),
+        db.Index('ix_reviews_product_status_rating', 'product_id', 'status', 'rating', 'timestamp', 'id'),
+        db.Index('ix_reviews_customer', 'customer_username'),
+        db.Index('ix_reviews_status', 'status'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -21,3 +30,38 @@ class Review(db.Model):
             "timestamp": self.timestamp,
             "status": self.status
         }
+
+
+# Moderation states of a review: submitted reviews are pending until moderated
+REVIEW_STATUSES = ('pending', 'approved', 'flagged')
+
+# Columns of Review.to_dict, to serialize rows without loading instances
+REVIEW_COLUMNS = (
+    Review.id, Review.product_id, Review.customer_username, Review.rating,
+    Review.comment, Review.timestamp, Review.status,
+)
+
+
+class ProductRatingSummary(db.Model):
+    """
+    Rating aggregates of the reviews of one product, over all reviews and over
+    approved ones only. Maintained by the review routes in the same transaction
+    as every review change (see ``services.review.ratings``).
+    """
+    __tablename__ = 'product_rating_summaries'
+
+    product_id = db.Column(db.Integer, primary_key=True)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_1 = db.Column(db.Integer, nullable=False, default=0)
+    rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_5 = db.Column(db.Integer, nullable=False, default=0)
+    approved_count = db.Column(db.Integer, nullable=False, default=0)
+    approved_sum = db.Column(db.Integer, nullable=False, default=0)
+    approved_1 = db.Column(db.Integer, nullable=False, default=0)
+    approved_2 = db.Column(db.Integer, nullable=False, default=0)
+    approved_3 = db.Column(db.Integer, nullable=False, default=0)
+    approved_4 = db.Column(db.Integer, nullable=False, default=0)
+    approved_5 = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,104 @@
+from collections import Counter
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.exc import IntegrityError
+from database.db_config import db
+from .models import ProductRatingSummary, Review
+
+RATINGS = range(1, 6)
+APPROVED = 'approved'
+
+
+def _contribution(rating, status):
+    # Summary columns a review with this rating and status counts towards
+    counts = Counter({"rating_count": 1, "rating_sum": rating, f"rating_{rating}": 1})
+    if status == APPROVED:
+        counts.update({"approved_count": 1, "approved_sum": rating, f"approved_{rating}": 1})
+    return counts
+
+
+def record_change(product_id, before=None, after=None):
+    """
+    Apply a review change to the rating summary of its product, in the current
+    transaction; the caller commits it together with the review.
+
+    Only the difference is written, with one ``UPDATE ... SET column = column + delta``,
+    so concurrent changes to reviews of the same product add up correctly.
+
+    :param product_id: ID of the reviewed product.
+    :param before: (rating, status) of the review before the change, or None if it is new.
+    :param after: (rating, status) of the review after the change, or None if it was deleted.
+    """
+    deltas = Counter()
+    if after is not None:
+        deltas.update(_contribution(*after))
+    if before is not None:
+        deltas.subtract(_contribution(*before))
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    columns = ProductRatingSummary.__table__.c
+    increment = (
+        update(ProductRatingSummary)
+        .where(ProductRatingSummary.product_id == product_id)
+        .values({columns[column]: columns[column] + delta for column, delta in deltas.items()})
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(increment).rowcount:
+        return
+    try:
+        # First review of the product; a savepoint keeps the transaction usable if another one won
+        with db.session.begin_nested():
+            db.session.execute(insert(ProductRatingSummary).values(product_id=product_id, **deltas))
+    except IntegrityError:
+        db.session.execute(increment)
+
+
+def summary_dict(summary, product_id):
+    """
+    Format a rating summary for responses.
+
+    :param summary: A ``ProductRatingSummary`` row, or None if the product has no reviews.
+    """
+    def stats(prefix, count, total):
+        return {
+            "count": count,
+            "average": round(total / count, 2) if count else None,
+            "histogram": {str(rating): getattr(summary, f"{prefix}_{rating}") if summary else 0 for rating in RATINGS},
+        }
+
+    if summary is None:
+        return {"product_id": product_id, **stats("rating", 0, 0), "approved": stats("approved", 0, 0)}
+    return {
+        "product_id": product_id,
+        **stats("rating", summary.rating_count, summary.rating_sum),
+        "approved": stats("approved", summary.approved_count, summary.approved_sum),
+    }
+
+
+def rebuild():
+    """
+    Recompute every rating summary from the reviews, in one transaction.
+
+    :return: The number of products with a summary.
+    """
+    approved = Review.status == APPROVED
+    aggregates = [
+        Review.product_id,
+        func.count(),
+        func.sum(Review.rating),
+        *[func.sum(case((Review.rating == rating, 1), else_=0)) for rating in RATINGS],
+        func.sum(case((approved, 1), else_=0)),
+        func.sum(case((approved, Review.rating), else_=0)),
+        *[func.sum(case((approved & (Review.rating == rating), 1), else_=0)) for rating in RATINGS],
+    ]
+    columns = ["product_id", "rating_count", "rating_sum", *[f"rating_{rating}" for rating in RATINGS],
+               "approved_count", "approved_sum", *[f"approved_{rating}" for rating in RATINGS]]
+
+    db.session.execute(delete(ProductRatingSummary))
+    db.session.execute(insert(ProductRatingSummary).from_select(
+        columns, db.select(*aggregates).group_by(Review.product_id)
+    ))
+    count = db.session.execute(db.select(func.count()).select_from(ProductRatingSummary)).scalar()
+    db.session.commit()
+    return count
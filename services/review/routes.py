@@ -1,25 +1,28 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+import click
 from database.db_config import db
-from .models import Review
+from .models import REVIEW_COLUMNS, REVIEW_STATUSES, ProductRatingSummary, Review
+from . import ratings
 from services.inventory.models import Inventory
-from services.customers.models import User
+from services.customers.auth import get_current_user, require_role
 from utils import profile_route, line_profile, memory_profile
+from etags import VersionCounter, conditional
+from serialization import row_dicts
+from database.pagination import NEXT_CURSOR_HEADER, limit_arg, seek_page
+from database.projection import fields_arg, with_columns
+from database.routing import use_replica
 
 reviews_bp = Blueprint('reviews', __name__)
 
-# Helper function to check admin role
-def authorize_admin():
-    """
-    Helper function to check if the currently logged-in user has admin privileges.
+# Version of the reviews of each product, bumped by every write to them
+review_versions = VersionCounter("reviews")
 
-    :return: A JSON response with an error message if access is forbidden, otherwise None.
-    """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-    if not user or user.role != 'admin':
-        return jsonify({"error": "Access forbidden"}), 403
-    return None
+# Sort keys of product reviews, each served by an index on (product_id, status, key...)
+REVIEW_SORT_KEYS = {
+    'timestamp': (Review.timestamp, Review.id),
+    'rating': (Review.rating, Review.timestamp, Review.id),
+}
 
 @reviews_bp.route('/submit', methods=['POST'])
 @jwt_required()
@@ -39,7 +42,7 @@ def submit_review():
     """
     try:
         current_user = get_jwt_identity()
-        user = User.query.filter_by(username=current_user).first()
+        user = get_current_user()
         if not user:
             return jsonify({"error": "User not found"}), 404
 
@@ -62,10 +65,13 @@ def submit_review():
             product_id=product_id,
             customer_username=current_user,
             rating=rating,
-            comment=comment
+            comment=comment,
+            status='pending'
         )
         db.session.add(review)
+        ratings.record_change(product_id, after=(rating, review.status))
         db.session.commit()
+        review_versions.bump(product_id)
 
         return jsonify({"message": "Review submitted successfully", "review": review.to_dict()}), 201
     except Exception as e:
@@ -90,10 +96,11 @@ def update_review(review_id):
     """
     try:
         current_user = get_jwt_identity()
-        review = Review.query.get(review_id)
+        review = db.session.get(Review, review_id, with_for_update=True)
         if not review or review.customer_username != current_user:
             return jsonify({"error": "Review not found or unauthorized"}), 404
 
+        before = (review.rating, review.status)
         data = request.json
         if "rating" in data:
             if not (1 <= data["rating"] <= 5):
@@ -102,7 +109,9 @@ def update_review(review_id):
         if "comment" in data:
             review.comment = data["comment"]
 
+        ratings.record_change(review.product_id, before=before, after=(review.rating, review.status))
         db.session.commit()
+        review_versions.bump(review.product_id)
         return jsonify({"message": "Review updated successfully", "review": review.to_dict()}), 200
     except Exception as e:
         db.session.rollback()
@@ -121,12 +130,15 @@ def delete_review(review_id):
     """
     try:
         current_user = get_jwt_identity()
-        review = Review.query.get(review_id)
+        review = db.session.get(Review, review_id, with_for_update=True)
         if not review or review.customer_username != current_user:
             return jsonify({"error": "Review not found or unauthorized"}), 404
 
+        product_id = review.product_id
+        ratings.record_change(product_id, before=(review.rating, review.status))
         db.session.delete(review)
         db.session.commit()
+        review_versions.bump(product_id)
         return jsonify({"message": "Review deleted successfully"}), 200
     except Exception as e:
         db.session.rollback()
@@ -135,21 +147,67 @@ def delete_review(review_id):
 @reviews_bp.route('/product/<int:product_id>', methods=['GET'])
 @profile_route
 @memory_profile
+@conditional(review_versions, key=lambda product_id: product_id)
 def get_product_reviews(product_id):
     """
-    Get all reviews for a specific product.
+    Get a page of the reviews of a specific product.
 
     :param product_id: ID of the product to fetch reviews for.
+    :query status: One of "approved" (default), "pending" or "flagged".
+    :query sort: One of "timestamp" or "rating"; prefix with "-" for descending
+                 order (default "-timestamp", newest first).
+    :query limit: Maximum number of reviews to return (default 50, at most 500).
+    :query cursor: The ``X-Next-Cursor`` header of the previous page.
+    :query fields: Comma-separated fields to return (default: all).
     :return: JSON response with a list of reviews or an error message.
+             The ``X-Next-Cursor`` header is missing on the last page.
+    """
+    try:
+        status = request.args.get('status', 'approved')
+        if status not in REVIEW_STATUSES:
+            return jsonify({"error": f"status must be one of {', '.join(REVIEW_STATUSES)}"}), 400
+        sort = request.args.get('sort', '-timestamp')
+        descending = sort.startswith('-')
+        columns = REVIEW_SORT_KEYS.get(sort.lstrip('-'))
+        if columns is None:
+            return jsonify({"error": f"sort must be one of {', '.join(REVIEW_SORT_KEYS)}"}), 400
+
+        # Only the requested columns are read, plus the sort key for the cursor
+        fields = fields_arg(REVIEW_COLUMNS)
+        query = db.session.query(*with_columns(fields, columns)).filter(
+            Review.product_id == product_id, Review.status == status
+        )
+        reviews, next_cursor = seek_page(query, columns, limit_arg(), request.args.get('cursor'), descending)
+
+        response = jsonify(row_dicts(reviews, [column.key for column in fields]))
+        if next_cursor is not None:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return response, 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@reviews_bp.route('/product/<int:product_id>/rating', methods=['GET'])
+@profile_route
+@memory_profile
+@conditional(review_versions, key=lambda product_id: product_id)
+def get_product_rating(product_id):
+    """
+    Get the rating summary of a product: count, average and 1-5 histogram of
+    all its reviews and of its approved reviews. Read from one precomputed row.
+
+    :param product_id: ID of the product.
+    :return: JSON response with the rating summary or an error message.
     """
     try:
-        reviews = Review.query.filter_by(product_id=product_id).all()
-        result = [review.to_dict() for review in reviews]
-        return jsonify(result), 200
+        summary = db.session.get(ProductRatingSummary, product_id)
+        return jsonify(ratings.summary_dict(summary, product_id)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @reviews_bp.route('/customer', methods=['GET'])
+@use_replica
 @jwt_required()
 @profile_route
 @memory_profile
@@ -157,18 +215,23 @@ def get_customer_reviews():
     """
     Get all reviews submitted by the currently logged-in customer.
 
+    :query fields: Comma-separated fields to return (default: all).
     :return: JSON response with a list of reviews or an error message.
     """
     try:
         current_user = get_jwt_identity()
-        reviews = Review.query.filter_by(customer_username=current_user).all()
-        result = [review.to_dict() for review in reviews]
-        return jsonify(result), 200
+        reviews = db.session.execute(
+            db.select(*fields_arg(REVIEW_COLUMNS)).where(Review.customer_username == current_user)
+        )
+        return jsonify(row_dicts(reviews)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @reviews_bp.route('/flag/<int:review_id>', methods=['POST'])
 @jwt_required()
+@require_role('admin')
 @profile_route
 @memory_profile
 def flag_review(review_id):
@@ -178,17 +241,17 @@ def flag_review(review_id):
     :param review_id: ID of the review to flag.
     :return: A JSON response indicating success or an error message.
     """
-    auth_error = authorize_admin()
-    if auth_error:
-        return auth_error
-
     try:
-        review = Review.query.get(review_id)
+        review = db.session.get(Review, review_id, with_for_update=True)
         if not review:
             return jsonify({"error": "Review not found"}), 404
 
+        before = (review.rating, review.status)
         review.status = 'flagged'
+        product_id = review.product_id
+        ratings.record_change(product_id, before=before, after=(review.rating, review.status))
         db.session.commit()
+        review_versions.bump(product_id)
 
         return jsonify({"message": f"Review has been flagged for moderation"}), 200
     except Exception as e:
@@ -197,6 +260,7 @@ def flag_review(review_id):
 
 @reviews_bp.route('/approve/<int:review_id>', methods=['POST'])
 @jwt_required()
+@require_role('admin')
 @profile_route
 @memory_profile
 def approve_review(review_id):
@@ -206,26 +270,31 @@ def approve_review(review_id):
     :param review_id: ID of the review to approve.
     :return: A JSON response indicating success or an error message.
     """
-    auth_error = authorize_admin()
-    if auth_error:
-        return auth_error
-
     try:
-        review = Review.query.get(review_id)
+        review = db.session.get(Review, review_id, with_for_update=True)
         if not review:
             return jsonify({"error": "Review not found"}), 404
 
         if review.status != 'flagged':
             return jsonify({"error": "Only flagged reviews can be approved"}), 400
 
+        before = (review.rating, review.status)
         review.status = 'approved'
+        product_id = review.product_id
+        ratings.record_change(product_id, before=before, after=(review.rating, review.status))
         db.session.commit()
+        review_versions.bump(product_id)
 
         return jsonify({"message": f"Review has been approved"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@reviews_bp.cli.command('rebuild-ratings')
+def rebuild_ratings():
+    """Recompute the rating summaries of all products from their reviews."""
+    click.echo(f"Rebuilt rating summaries of {ratings.rebuild()} products")
+
 @reviews_bp.route('/health', methods=['GET'])
 @profile_route
 @memory_profile
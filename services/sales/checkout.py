@@ -0,0 +1,167 @@
+from datetime import datetime
+from sqlalchemy import case, insert, update
+from sqlalchemy.exc import OperationalError
+from database.db_config import db
+from services.customers import wallet
+from services.inventory.models import Inventory
+from .models import Sale
+
+# MySQL error codes of a lock wait timeout and a deadlock
+_CONTENTION_ERRORS = (1205, 1213)
+# Retry-After sent when a checkout lost a lock race, in seconds
+CONTENDED_RETRY_AFTER = 1
+
+
+class CheckoutError(Exception):
+    """A checkout that was rolled back; ``status_code`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=400, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def checkout(username, product_id, quantity):
+    """
+    Buy ``quantity`` units of a product for a customer.
+
+    Stock is changed with a guarded single-statement update
+    (``SET stock_count = stock_count - q WHERE ... AND stock_count >= q``), so
+    the check and the write are atomic without reading the row first and
+    concurrent buyers can neither oversell nor overwrite each other's updates.
+    The price is debited through the wallet ledger (:func:`wallet.debit`).
+    Rows are always locked in the same order (inventory, then the user's
+    wallet) and the transaction holds its locks only until the sale is inserted.
+
+    The caller commits the transaction, or rolls it back on error.
+
+    :param username: Username of the buying customer.
+    :param product_id: ID of the product to buy.
+    :param quantity: Number of units to buy.
+    :return: The details of the recorded sale, as returned by ``Sale.to_dict``.
+    :raises CheckoutError: If the product or user does not exist, stock or funds
+                           are insufficient, or a lock could not be acquired in
+                           time (503, to be retried).
+    """
+    try:
+        product = db.session.execute(
+            db.select(Inventory.name, Inventory.price_per_item).where(Inventory.id == product_id)
+        ).first()
+        if not product:
+            raise CheckoutError("Product not found", 404)
+        total_price = product.price_per_item * quantity
+
+        stock = db.session.execute(
+            update(Inventory)
+            .where(Inventory.id == product_id, Inventory.stock_count >= quantity)
+            .values(stock_count=Inventory.stock_count - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if stock.rowcount != 1:
+            raise CheckoutError("Insufficient stock")
+
+        _debit_wallet(username, total_price)
+
+        sale = Sale(
+            customer_username=username,
+            product_id=product_id,
+            product_name=product.name,
+            quantity=quantity,
+            total_price=total_price,
+            timestamp=datetime.utcnow(),
+        )
+        db.session.add(sale)
+        db.session.flush()
+        # Serialized before the commit expires the instance, saving a reload
+        return sale.to_dict()
+    except OperationalError as e:
+        if _is_contention(e):
+            raise CheckoutError("Checkout is busy, try again", 503, CONTENDED_RETRY_AFTER)
+        raise
+
+
+def checkout_cart(username, items):
+    """
+    Buy several products at once for a customer.
+
+    All products are read with one ``IN`` query, stock and the order total are
+    validated in a single pass, then one guarded ``UPDATE`` decrements the stock
+    of every product (``WHERE id IN (...) AND stock_count >= CASE id ... END``),
+    the wallet is debited once and all sales are inserted with one multi-row
+    ``INSERT``. Either every line is bought or none is.
+
+    The caller commits the transaction, or rolls it back on error.
+
+    :param username: Username of the buying customer.
+    :param items: Mapping of product ID to the quantity to buy.
+    :return: A tuple (sales, total_price); ``sales`` holds the details of every
+             recorded sale.
+    :raises CheckoutError: If a product or the user does not exist, stock or
+                           funds are insufficient, or a lock could not be
+                           acquired in time (503, to be retried).
+    """
+    try:
+        products = {
+            product.id: product
+            for product in db.session.execute(
+                db.select(Inventory.id, Inventory.name, Inventory.price_per_item, Inventory.stock_count)
+                .where(Inventory.id.in_(items))
+            )
+        }
+        missing = sorted(set(items) - set(products))
+        if missing:
+            raise CheckoutError(f"Product not found: {', '.join(map(str, missing))}", 404)
+        short = sorted(product_id for product_id, quantity in items.items()
+                       if products[product_id].stock_count < quantity)
+        if short:
+            raise CheckoutError(f"Insufficient stock: {', '.join(map(str, short))}")
+        total_price = sum(products[product_id].price_per_item * quantity for product_id, quantity in items.items())
+
+        quantities = case(items, value=Inventory.id)
+        stock = db.session.execute(
+            update(Inventory)
+            .where(Inventory.id.in_(items), Inventory.stock_count >= quantities)
+            .values(stock_count=Inventory.stock_count - quantities)
+            .execution_options(synchronize_session=False)
+        )
+        if stock.rowcount != len(items):
+            # Another order took the stock since it was read
+            raise CheckoutError("Insufficient stock")
+
+        _debit_wallet(username, total_price)
+
+        timestamp = datetime.utcnow()
+        sales = [
+            {
+                "customer_username": username,
+                "product_id": product_id,
+                "product_name": products[product_id].name,
+                "quantity": quantity,
+                "total_price": products[product_id].price_per_item * quantity,
+                "timestamp": timestamp,
+            }
+            for product_id, quantity in items.items()
+        ]
+        db.session.execute(insert(Sale), sales)
+        return sales, total_price
+    except OperationalError as e:
+        if _is_contention(e):
+            raise CheckoutError("Checkout is busy, try again", 503, CONTENDED_RETRY_AFTER)
+        raise
+
+
+def _debit_wallet(username, amount):
+    try:
+        wallet.debit(username, wallet.to_cents(amount), "sale")
+    except wallet.UnknownUser:
+        raise CheckoutError("User not found", 404)
+    except wallet.InsufficientFunds:
+        raise CheckoutError("Insufficient wallet balance")
+
+
+def _is_contention(error):
+    args = getattr(error.orig, "args", ())
+    if args and args[0] in _CONTENTION_ERRORS:
+        return True
+    # SQLite reports a busy database instead of a row lock
+    return "database is locked" in str(error.orig)
@@ -11,6 +11,11 @@ class Sale(db.Model):
     total_price = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=db.func.now())
 
+    # Purchase history of a customer, optionally within a time range
+    __table_args__ = (
+        db.Index('ix_sales_customer_timestamp', 'customer_username', 'timestamp'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -21,3 +26,10 @@ class Sale(db.Model):
             "total_price": self.total_price,
             "timestamp": self.timestamp
         }
+
+
+# Columns of Sale.to_dict, to serialize rows without loading instances
+SALE_COLUMNS = (
+    Sale.id, Sale.customer_username, Sale.product_id, Sale.product_name,
+    Sale.quantity, Sale.total_price, Sale.timestamp,
+)
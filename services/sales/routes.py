@@ -1,28 +1,47 @@
-from flask import Blueprint, request, jsonify
+from datetime import datetime, timezone
+from flask import Blueprint, Response, json, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from database.db_config import db
-from .models import Sale
-from services.customers.models import User
+from .models import SALE_COLUMNS, Sale
+from .checkout import CheckoutError, checkout, checkout_cart
+from services.inventory.cache import catalog_cache
 from services.inventory.models import Inventory
+from database.projection import fields_arg, pick
+from database.routing import use_replica
 from utils import profile_route, line_profile, memory_profile
+from etags import conditional
+from serialization import row_dicts
 
 sales_bp = Blueprint('sales', __name__)
 
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Largest number of distinct lines accepted in one cart checkout
+MAX_CART_ITEMS = 100
+# Rows fetched from the server-side cursor at a time when streaming
+STREAM_BATCH_SIZE = 500
+# Fields of the goods listing
+DISPLAY_COLUMNS = (Inventory.name, Inventory.price_per_item.label("price"))
+
 @sales_bp.route('/display', methods=['GET'])
 @profile_route  # Adding the route profiler
 @line_profile  # Adding the line profiler (optional, for more granular profiling)
 @memory_profile  # Adding memory profiling
+@conditional(catalog_cache.versions)
 def display_goods():
     """
     Display a list of all available goods.
 
+    :query fields: Comma-separated fields to return, "name" and/or "price" (default: both).
     :return: JSON response containing a list of goods with their names and prices,
              or an error message in case of failure.
     """
     try:
-        items = Inventory.query.all()
-        result = [{"name": item.name, "price": item.price_per_item} for item in items]
-        return jsonify(result), 200
+        fields = fields_arg(DISPLAY_COLUMNS)
+        items = catalog_cache.listing()
+        result = [{"name": item["name"], "price": item["price_per_item"]} for item in items]
+        return jsonify(result if len(fields) == len(DISPLAY_COLUMNS) else pick(result, fields)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -37,10 +56,10 @@ def get_good_details(item_id):
     :return: JSON response containing the item's details, or an error message.
     """
     try:
-        item = Inventory.query.get(item_id)
+        item = catalog_cache.item(item_id)
         if not item:
             return jsonify({"error": "Item not found"}), 404
-        return jsonify(item.to_dict()), 200
+        return jsonify(item), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -61,9 +80,6 @@ def make_sale():
     """
     try:
         current_user = get_jwt_identity()
-        user = User.query.filter_by(username=current_user).first()
-        if not user:
-            return jsonify({"error": "User not found"}), 404
 
         data = request.json
         product_id = data.get('product_id')
@@ -72,40 +88,71 @@ def make_sale():
         if not product_id or not quantity or quantity <= 0:
             return jsonify({"error": "Invalid product or quantity"}), 400
 
-        item = Inventory.query.get(product_id)
-        if not item:
-            return jsonify({"error": "Product not found"}), 404
-        if item.stock_count < quantity:
-            return jsonify({"error": "Insufficient stock"}), 400
-
-        total_price = item.price_per_item * quantity
-        if user.wallet_balance < total_price:
-            return jsonify({"error": "Insufficient wallet balance"}), 400
-
-        # Deduct from customer wallet
-        user.wallet_balance -= total_price
-        # Deduct stock
-        item.stock_count -= quantity
-        # Record the sale
-        sale = Sale(
-            customer_username=current_user,
-            product_id=item.id,
-            product_name=item.name,
-            quantity=quantity,
-            total_price=total_price
-        )
-        db.session.add(sale)
+        # Stock and wallet are checked and updated atomically by the database
+        sale_details = checkout(current_user, product_id, quantity)
         db.session.commit()
+        catalog_cache.items_changed(product_id)
 
         return jsonify({
             "message": "Sale completed successfully",
-            "sale_details": sale.to_dict()
+            "sale_details": sale_details
+        }), 200
+    except CheckoutError as e:
+        db.session.rollback()
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else {}
+        return jsonify({"error": str(e)}), e.status_code, headers
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@sales_bp.route('/cart', methods=['POST'])
+@jwt_required()
+@profile_route
+@memory_profile
+def checkout_cart_items():
+    """
+    Buy several products in one order. Either all items are bought or none.
+
+    :request json: {
+        "items": [{"product_id": int, "quantity": int}, ...]  # Lines of the order
+    }
+    :return: JSON response with the details of every sale and the order total, or an error message.
+    """
+    try:
+        current_user = get_jwt_identity()
+
+        lines = (request.json or {}).get('items')
+        if not lines or not isinstance(lines, list) or len(lines) > MAX_CART_ITEMS:
+            return jsonify({"error": f"items must be a list of 1 to {MAX_CART_ITEMS} products"}), 400
+
+        # Lines for the same product are merged
+        items = {}
+        for line in lines:
+            product_id = line.get('product_id') if isinstance(line, dict) else None
+            quantity = line.get('quantity') if isinstance(line, dict) else None
+            if not isinstance(product_id, int) or not isinstance(quantity, int) or quantity <= 0:
+                return jsonify({"error": "Invalid product or quantity"}), 400
+            items[product_id] = items.get(product_id, 0) + quantity
+
+        sales, total_price = checkout_cart(current_user, items)
+        db.session.commit()
+        catalog_cache.items_changed(*items)
+
+        return jsonify({
+            "message": "Order completed successfully",
+            "total_price": total_price,
+            "sales": sales
         }), 200
+    except CheckoutError as e:
+        db.session.rollback()
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else {}
+        return jsonify({"error": str(e)}), e.status_code, headers
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 @sales_bp.route('/history', methods=['GET'])
+@use_replica
 @jwt_required()
 @profile_route
 @memory_profile
@@ -113,12 +160,47 @@ def get_purchase_history():
     """
     Retrieve the purchase history for the logged-in customer.
 
+    :query since: Only purchases made at or after this ISO 8601 timestamp.
+    :query until: Only purchases made before this ISO 8601 timestamp.
+    :query stream: If "1", or if the client accepts application/x-ndjson, stream
+                   one JSON object per line instead of building one array.
+    :query fields: Comma-separated fields to return (default: all).
     :return: JSON response containing a list of past purchases or an error message.
     """
     try:
         current_user = get_jwt_identity()
-        sales = Sale.query.filter_by(customer_username=current_user).all()
-        result = [sale.to_dict() for sale in sales]
-        return jsonify(result), 200
+        query = db.session.query(*fields_arg(SALE_COLUMNS)).filter(Sale.customer_username == current_user)
+        since = _timestamp_arg('since')
+        if since is not None:
+            query = query.filter(Sale.timestamp >= since)
+        until = _timestamp_arg('until')
+        if until is not None:
+            query = query.filter(Sale.timestamp < until)
+
+        if request.args.get('stream') == '1' or request.accept_mimetypes.best == NDJSON_MIMETYPE:
+            # Rows are read through a server-side cursor in batches and sent as
+            # they arrive, so memory stays flat and the first byte goes out early
+            def generate():
+                for sale in query.order_by(Sale.id).yield_per(STREAM_BATCH_SIZE):
+                    yield json.dumps(sale._asdict()) + "\n"
+            return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+        return jsonify(row_dicts(query)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+def _timestamp_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 timestamp")
+    # Sale timestamps are stored as naive UTC
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
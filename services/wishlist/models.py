@@ -7,9 +7,18 @@ class Wishlist(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     item_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False)
 
+    # An item is at most once in a wishlist; also serves lookups by user
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'item_id', name='uq_wishlist_user_item'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
             "user_id": self.user_id,
             "item_id": self.item_id,
         }
+
+
+# Columns of Wishlist.to_dict, to serialize rows without loading instances
+WISHLIST_COLUMNS = (Wishlist.id, Wishlist.user_id, Wishlist.item_id)
@@ -1,28 +1,19 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
+from sqlalchemy.exc import IntegrityError
 from database.db_config import db
-from services.wishlist.models import Wishlist
+from services.wishlist.models import WISHLIST_COLUMNS, Wishlist
 from services.inventory.models import Inventory
-from services.customers.models import User
+from services.customers.auth import get_current_user_id, require_role
 from utils import profile_route, line_profile, memory_profile
+from serialization import row_dicts
+from database.projection import fields_arg
 
 wishlist_bp = Blueprint('wishlist', __name__)
 
-# Helper function to check customer role
-def authorize_customer():
-    """
-    Helper function to check if the currently logged-in user has customer privileges.
-
-    :return: A JSON response with an error message if access is forbidden, otherwise None.
-    """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-    if not user or user.role != 'customer':
-        return jsonify({"error": "Access forbidden"}), 403
-    return None
-
 @wishlist_bp.route('/add', methods=['POST'])
 @jwt_required()
+@require_role('customer')
 @profile_route
 @memory_profile
 def add_to_wishlist():
@@ -34,12 +25,8 @@ def add_to_wishlist():
     }
     :return: A JSON response with a success message, or an error message if the item is already in the wishlist or not found.
     """
-    auth_error = authorize_customer()
-    if auth_error:
-        return auth_error
-
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
+    # Id of the logged-in customer, from the token claims
+    user_id = get_current_user_id()
 
     data = request.json
     item_id = data.get('item_id')
@@ -50,43 +37,51 @@ def add_to_wishlist():
         return jsonify({"error": "Item not found"}), 404
 
     # Check if the item is already in the user's wishlist
-    existing_entry = Wishlist.query.filter_by(user_id=user.id, item_id=item_id).first()
+    existing_entry = Wishlist.query.filter_by(user_id=user_id, item_id=item_id).first()
     if existing_entry:
         return jsonify({"message": f"'{item.name}' is already in your wishlist"}), 200
 
     # Add item to wishlist
-    wishlist_entry = Wishlist(user_id=user.id, item_id=item_id)
+    wishlist_entry = Wishlist(user_id=user_id, item_id=item_id)
     db.session.add(wishlist_entry)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request added it since the check above
+        db.session.rollback()
+        return jsonify({"message": f"'{item.name}' is already in your wishlist"}), 200
 
     return jsonify({"message": f"'{item.name}' has been added to your wishlist"}), 201
 
 
 @wishlist_bp.route('/', methods=['GET'])
 @jwt_required()
+@require_role('customer')
 @line_profile
 @memory_profile
 def view_wishlist():
     """
     View the items in the user's wishlist (customer only).
 
+    :query fields: Comma-separated fields to return (default: all).
     :return: A JSON response with a list of wishlist items, or an error message if access is forbidden.
     """
-    auth_error = authorize_customer()
-    if auth_error:
-        return auth_error
+    try:
+        fields = fields_arg(WISHLIST_COLUMNS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
+    # Id of the logged-in customer, from the token claims
+    user_id = get_current_user_id()
 
     # Fetch wishlist items for the user
-    wishlist = Wishlist.query.filter_by(user_id=user.id).all()
-    result = [entry.to_dict() for entry in wishlist]
+    wishlist = db.session.execute(db.select(*fields).where(Wishlist.user_id == user_id))
 
-    return jsonify(result), 200
+    return jsonify(row_dicts(wishlist)), 200
 
 @wishlist_bp.route('/<int:item_id>', methods=['DELETE'])
 @jwt_required()
+@require_role('customer')
 @profile_route
 @memory_profile
 def remove_from_wishlist(item_id):
@@ -96,15 +91,11 @@ def remove_from_wishlist(item_id):
     :param item_id: ID of the wishlist item to remove.
     :return: A JSON response with a success message, or an error message if the item is not in the wishlist.
     """
-    auth_error = authorize_customer()
-    if auth_error:
-        return auth_error
-
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
+    # Id of the logged-in customer, from the token claims
+    user_id = get_current_user_id()
 
     # Find the wishlist entry
-    wishlist_entry = Wishlist.query.filter_by(user_id=user.id, item_id=item_id).first()
+    wishlist_entry = Wishlist.query.filter_by(user_id=user_id, item_id=item_id).first()
     if not wishlist_entry:
         return jsonify({"error": "Item not in wishlist"}), 404
 
@@ -1,7 +1,12 @@
 import pytest
 from app import app, db
 from services.inventory.models import Inventory
+from database.query_stats import query_budget
+from services.inventory import search
+from services.inventory.search import SEARCH_LATENCY, search_index
+from contextlib import contextmanager
 from services.customers.models import User
+from services.inventory.cache import catalog_cache
 from flask_jwt_extended import create_access_token
 import sys
 import os
@@ -22,6 +27,8 @@ def client():
         with app.app_context():
             db.drop_all()
             db.create_all()  # Initialize tables
+            catalog_cache.clear()  # The cache outlives the recreated tables
+            search_index.clear()
         yield client
         with app.app_context():
             db.session.remove()
@@ -145,3 +152,143 @@ def test_get_all_items(client, customer_auth_headers):
     response = client.get('/inventory/', headers=customer_auth_headers)
     assert response.status_code == 200
     assert len(response.json) == 2  # Two items added
+
+
+def test_cached_listing_skips_database(client, customer_auth_headers):
+    """Test that a repeated listing is served from the catalog cache, after a version lookup."""
+    with app.app_context():
+        db.session.add(Inventory(name="Item1", category="electronics", price_per_item=100.0, stock_count=5))
+        db.session.commit()
+
+    assert len(client.get('/inventory/', headers=customer_auth_headers).json) == 1
+    with query_budget(2):
+        assert client.get('/inventory/', headers=customer_auth_headers).status_code == 200
+        assert client.get('/sales/display').json == [{"name": "Item1", "price": 100.0}]
+
+
+def test_cache_written_through_on_update(client, admin_auth_headers, customer_auth_headers):
+    """Test that cached listings and items reflect inventory changes immediately."""
+    client.post('/inventory/add', json={
+        "name": "Tablet", "category": "electronics", "price_per_item": 500.0, "stock_count": 15
+    }, headers=admin_auth_headers)
+    assert client.get('/sales/details/1').json['price_per_item'] == 500.0
+    assert client.get('/inventory/', headers=customer_auth_headers).json[0]['stock_count'] == 15
+
+    client.patch('/inventory/1/update', json={"price_per_item": 550.0}, headers=admin_auth_headers)
+    client.post('/inventory/1/deduct', json={"quantity": 5}, headers=admin_auth_headers)
+
+    with query_budget(0):
+        item = client.get('/sales/details/1').json
+    assert (item['price_per_item'], item['stock_count']) == (550.0, 10)
+    assert client.get('/inventory/', headers=customer_auth_headers).json[0]['stock_count'] == 10
+
+
+def _add_catalog_items():
+    with app.app_context():
+        db.session.add_all([
+            Inventory(name="Apple", category="food", price_per_item=1.5, stock_count=10),
+            Inventory(name="Bread", category="food", price_per_item=3.0, stock_count=0),
+            Inventory(name="Cheese", category="food", price_per_item=7.0, stock_count=4),
+            Inventory(name="Shirt", category="clothes", price_per_item=20.0, stock_count=2),
+            Inventory(name="Dates", category="food", price_per_item=3.0, stock_count=8),
+        ])
+        db.session.commit()
+
+
+def test_catalog_filters(client):
+    """Test filtering the catalog by category, price range and stock."""
+    _add_catalog_items()
+    response = client.get('/inventory/catalog?category=food&min_price=2&max_price=7&in_stock=true')
+    assert response.status_code == 200
+    assert [item['name'] for item in response.json] == ["Cheese", "Dates"]
+
+
+def test_catalog_sorted_pagination(client):
+    """Test paging through the catalog sorted by descending price."""
+    _add_catalog_items()
+    names = []
+    cursor = None
+    while True:
+        url = '/inventory/catalog?sort=-price&limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        names += [item['name'] for item in response.json]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    # Items with the same price are ordered by descending id
+    assert names == ["Shirt", "Cheese", "Dates", "Bread", "Apple"]
+
+
+def test_catalog_fields(client):
+    """Test paging through the catalog with only some fields selected."""
+    _add_catalog_items()
+    response = client.get('/inventory/catalog?sort=price&limit=3&fields=name')
+    assert response.json == [{"name": "Apple"}, {"name": "Bread"}, {"name": "Dates"}]
+
+    response = client.get('/inventory/catalog?sort=price&limit=3&fields=name&cursor='
+                          + response.headers['X-Next-Cursor'])
+    assert response.json == [{"name": "Cheese"}, {"name": "Shirt"}]
+
+
+def test_catalog_invalid_arguments(client):
+    """Test that invalid catalog arguments are rejected."""
+    assert client.get('/inventory/catalog?sort=stock').status_code == 400
+    assert client.get('/inventory/catalog?min_price=cheap').status_code == 400
+    assert client.get('/inventory/catalog?cursor=garbage').status_code == 400
+    assert client.get('/inventory/catalog?fields=').status_code == 400
+
+
+def test_search_ranks_matches(client, admin_auth_headers):
+    """Test that search ranks name matches first, matches prefixes and follows updates."""
+    for name, category, description in [
+        ("Wireless Headphones", "electronics", "Noise cancelling over-ear headphones"),
+        ("Phone Case", "accessories", "Fits most phones"),
+        ("Desk Lamp", "furniture", "Warm light, wireless charging base"),
+    ]:
+        client.post('/inventory/add', json={"name": name, "category": category, "price_per_item": 10.0,
+                                            "description": description}, headers=admin_auth_headers)
+
+    response = client.get('/inventory/search?q=wireless&fields=name')
+    assert response.status_code == 200
+    assert response.json == [{"name": "Wireless Headphones"}, {"name": "Desk Lamp"}]
+    assert [item['name'] for item in client.get('/inventory/search?q=phone').json][0] == "Phone Case"
+    assert [item['name'] for item in client.get('/inventory/search?q=head').json] == ["Wireless Headphones"]
+    assert client.get('/inventory/search?q=sofa').json == []
+
+    client.patch('/inventory/3/update', json={"description": "Warm light"}, headers=admin_auth_headers)
+    assert [item['name'] for item in client.get('/inventory/search?q=wireless').json] == ["Wireless Headphones"]
+
+
+def test_search_builds_index_from_database(client):
+    """Test that items written without the routes are found, and that the query time is measured."""
+    _add_catalog_items()
+    searches = SEARCH_LATENCY.count
+    response = client.get('/inventory/search?q=che&limit=1')
+    assert response.json[0]['name'] == "Cheese"
+    assert SEARCH_LATENCY.count == searches + 1
+    assert client.get('/inventory/search?q=').status_code == 400
+
+
+
+def test_search_rebuild_keeps_changes_made_meanwhile(client, monkeypatch):
+    """Test that a rebuild swaps in a new index without losing items indexed while it read the table."""
+    _add_catalog_items()
+
+    @contextmanager
+    def add_during_rebuild():
+        search_index.item_changed(Inventory(id=99, name="Grapes", category="food"))
+        yield
+
+    monkeypatch.setattr(search, "use_primary", add_during_rebuild)
+    with app.app_context():
+        search_index.rebuild()
+    assert [item_id for item_id, score in search_index.search("grap", 5)] == [99]
+    assert len(search_index) == 6
+
+
+def test_search_prefix_expansion_limit():
+    """Test that a query word expands to at most MAX_PREFIX_TERMS indexed words."""
+    data = search._IndexData((index, {"name": f"word{index}"}) for index in range(search.MAX_PREFIX_TERMS + 5))
+    assert len(data.matches("word")) == search.MAX_PREFIX_TERMS
+    assert data.terms == sorted(data.postings)
@@ -0,0 +1,100 @@
+import pytest
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token
+from database import init_app, db
+from database.routing import use_replica
+from etags import VersionCounter, conditional
+from serialization import FastJSONProvider
+from services.customers.models import User
+from services.inventory.models import Inventory
+from services.sales.models import Sale
+from services.sales.routes import sales_bp
+from services.inventory.cache import catalog_cache
+import sys
+import os
+
+# Ensure the test suite can locate the app and services
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    """Fixture creating an app whose primary and replica are two SQLite files with different data."""
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'primary.db'}"
+    app.config['SQLALCHEMY_BINDS'] = {"replica1": f"sqlite:///{tmp_path / 'replica.db'}"}
+    app.config['JWT_SECRET_KEY'] = 'testsecret'
+    init_app(app)
+    JWTManager(app)
+    app.register_blueprint(sales_bp, url_prefix='/sales')
+
+    with app.app_context():
+        db.create_all()
+        catalog_cache.clear()  # The cache outlives the recreated tables
+        # Replicas are not managed by create_all; create the same tables there
+        db.metadata.create_all(db.engines["replica1"])
+        for username in ("replicauser", "otherreader"):
+            db.session.add(User(full_name=username, username=username, password="unused",
+                                role="customer", wallet_balance=100.0))
+        db.session.add(Inventory(name="Item1", category="Category1", price_per_item=10, stock_count=10))
+        db.session.add(Sale(customer_username="replicauser", product_id=1, product_name="On primary",
+                            quantity=1, total_price=10))
+        db.session.commit()
+        with db.engines["replica1"].begin() as connection:
+            connection.execute(db.insert(Sale), [
+                {"customer_username": username, "product_id": 1, "product_name": "On replica",
+                 "quantity": 1, "total_price": 10}
+                for username in ("replicauser", "otherreader")
+            ])
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    # The bind's metadata is shared by all apps; other tests' create_all must not see it
+    db.metadatas.pop("replica1", None)
+
+
+def _headers(app, username):
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity=username)}"}
+
+
+def _history(client, headers):
+    response = client.get('/sales/history', headers=headers)
+    assert response.status_code == 200
+    return {sale["product_name"] for sale in response.json}
+
+
+def test_reads_go_to_replica_until_own_write(replica_app):
+    """Test that history is read from the replica, except right after the reader's own write."""
+    headers = _headers(replica_app, "replicauser")
+    other = _headers(replica_app, "otherreader")
+    client = replica_app.test_client()
+
+    assert _history(client, headers) == {"On replica"}
+
+    response = client.post('/sales/sale', json={"product_id": 1, "quantity": 1}, headers=headers)
+    assert response.status_code == 200
+    assert 'db_last_write=' in response.headers['Set-Cookie']
+    # The sale went to the primary, and the writer now reads it back from there
+    assert _history(client, headers) == {"On primary", "Item1"}
+    # Also from another client (e.g. without the cookie), by the user in the token
+    assert _history(replica_app.test_client(), headers) == {"On primary", "Item1"}
+    # Other users keep reading from the replica
+    assert _history(replica_app.test_client(), other) == {"On replica"}
+
+
+def test_conditional_routes_read_from_primary(replica_app):
+    """Test that a route answering conditional GETs reads from the primary despite use_replica."""
+    @replica_app.route('/conditional-sales')
+    @use_replica
+    @conditional(VersionCounter("test-sales"))
+    def conditional_sales():
+        return jsonify(sorted({sale.product_name for sale in db.session.execute(db.select(Sale)).scalars()}))
+
+    response = replica_app.test_client().get('/conditional-sales')
+    assert response.json == ["On primary"]
+    assert response.headers['ETag']
@@ -3,7 +3,9 @@ from app import app, db
 from services.customers.models import User
 from services.inventory.models import Inventory
 from services.review.models import Review
+from services.inventory.cache import catalog_cache
 from flask_jwt_extended import create_access_token
+from datetime import datetime
 import sys
 import os
 
@@ -22,6 +24,7 @@ def client():
         with app.app_context():
             db.drop_all()
             db.create_all()
+            catalog_cache.clear()  # The cache outlives the recreated tables
             # Create a test user, admin user, and inventory item
             test_user = User(
                 full_name="Test User",
@@ -153,8 +156,9 @@ def test_get_product_reviews(client, create_review):
     """Test fetching reviews for a specific product."""
     product_id = create_review["review"]["product_id"]
 
-    # Fetch the reviews for the product
-    response = client.get(f'/reviews/product/{product_id}')
+    # Fetch the reviews for the product; new reviews are pending moderation
+    assert client.get(f'/reviews/product/{product_id}').json == []
+    response = client.get(f'/reviews/product/{product_id}?status=pending')
     assert response.status_code == 200
 
     reviews = response.get_json()
@@ -162,6 +166,51 @@ def test_get_product_reviews(client, create_review):
     assert len(reviews) > 0
     assert reviews[0]["product_id"] == product_id
 
+def test_product_reviews_conditional_get(client, auth_headers, admin_auth_headers, create_review):
+    """Test that product reviews are answered with 304 until one of them changes."""
+    etag = client.get('/reviews/product/1').headers['ETag']
+    assert client.get('/reviews/product/1', headers={"If-None-Match": etag}).status_code == 304
+
+    client.post('/reviews/flag/1', headers=admin_auth_headers)
+    response = client.get('/reviews/product/1?status=flagged', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json[0]["status"] == "flagged"
+
+def test_product_reviews_pages(client, auth_headers):
+    """Test paging through approved reviews, newest first and by rating."""
+    with app.app_context():
+        for index, rating in enumerate([3, 5, 1, 5, 4]):
+            db.session.add(Review(product_id=1, customer_username="testuser", rating=rating, comment=f"Review {index}",
+                                  status="approved", timestamp=datetime(2024, 1, 1 + index)))
+        db.session.add(Review(product_id=1, customer_username="testuser", rating=2, comment="Pending",
+                              status="pending", timestamp=datetime(2024, 2, 1)))
+        db.session.commit()
+
+    comments = []
+    url = '/reviews/product/1?limit=2&fields=comment'
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        comments += [review["comment"] for review in response.json]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+        url = f'/reviews/product/1?limit=2&fields=comment&cursor={cursor}'
+    assert comments == [f"Review {index}" for index in (4, 3, 2, 1, 0)]
+
+    first = client.get('/reviews/product/1?sort=-rating&limit=3')
+    second = client.get(f"/reviews/product/1?sort=-rating&limit=3&cursor={first.headers['X-Next-Cursor']}")
+    ratings = [review["rating"] for review in first.json + second.json]
+    assert ratings == [5, 5, 4, 3, 1]
+    # Equal ratings are newest first
+    assert [review["comment"] for review in first.json[:2]] == ["Review 3", "Review 1"]
+
+def test_product_reviews_invalid_args(client):
+    """Test that unknown statuses, sorts and cursors are rejected."""
+    assert client.get('/reviews/product/1?status=deleted').status_code == 400
+    assert client.get('/reviews/product/1?sort=comment').status_code == 400
+    assert client.get('/reviews/product/1?cursor=bogus').status_code == 400
+
 def test_get_customer_reviews(client, auth_headers):
     """Test fetching reviews submitted by the logged-in customer."""
     # Submit a review first
@@ -232,3 +281,37 @@ def test_approve_unflagged_review(client, admin_auth_headers, create_review):
     response = client.post(f'/reviews/approve/{review_id}', headers=admin_auth_headers)
     assert response.status_code == 400
     assert b"Only flagged reviews can be approved" in response.data
+
+def test_product_rating_summary(client, auth_headers, admin_auth_headers, create_review):
+    """Test that the rating summary follows every review change, and matches a rebuild."""
+    client.post('/reviews/submit', json={"product_id": 1, "rating": 3, "comment": "Fine."}, headers=auth_headers)
+    response = client.get('/reviews/product/1/rating')
+    assert response.status_code == 200
+    assert response.json["count"] == 2
+    assert response.json["average"] == 4.0
+    assert response.json["histogram"] == {"1": 0, "2": 0, "3": 1, "4": 0, "5": 1}
+    assert response.json["approved"] == {"count": 0, "average": None,
+                                         "histogram": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0}}
+
+    client.patch('/reviews/update/2', json={"rating": 1}, headers=auth_headers)
+    client.post('/reviews/flag/1', headers=admin_auth_headers)
+    client.post('/reviews/approve/1', headers=admin_auth_headers)
+    summary = client.get('/reviews/product/1/rating').json
+    assert summary["histogram"] == {"1": 1, "2": 0, "3": 0, "4": 0, "5": 1}
+    assert summary["approved"] == {"count": 1, "average": 5.0, "histogram": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 1}}
+
+    client.delete('/reviews/delete/2', headers=auth_headers)
+    summary = client.get('/reviews/product/1/rating').json
+    assert summary["count"] == 1
+    assert summary["average"] == 5.0
+
+    result = app.test_cli_runner().invoke(args=["reviews", "rebuild-ratings"])
+    assert "Rebuilt rating summaries of 1 products" in result.output
+    assert client.get('/reviews/product/1/rating').json == summary
+
+def test_product_rating_summary_without_reviews(client):
+    """Test the rating summary of a product nobody reviewed."""
+    response = client.get('/reviews/product/1/rating')
+    assert response.status_code == 200
+    assert response.json["count"] == 0
+    assert response.json["average"] is None
@@ -3,7 +3,12 @@ from app import app, db
 from services.customers.models import User
 from services.inventory.models import Inventory
 from services.sales.models import Sale
+from services.customers.wallet import get_balance
+from services.inventory.cache import catalog_cache
+from etags import VersionCounter
 from flask_jwt_extended import create_access_token
+from datetime import datetime
+import json
 import sys
 import os
 
@@ -21,6 +26,7 @@ def client():
     with app.test_client() as client:
         with app.app_context():
             db.create_all()  # Initialize tables
+            catalog_cache.clear()  # The cache outlives the recreated tables
 
         yield client
 
@@ -78,11 +84,56 @@ def test_get_good_details(client, setup_inventory):
     assert response.status_code == 404
     assert b"Item not found" in response.data
 
+def test_display_goods_conditional_get(client, auth_headers, setup_inventory):
+    """Test that an unchanged listing is answered with 304 and a sale changes its ETag."""
+    response = client.get('/sales/display')
+    etag = response.headers['ETag']
+
+    response = client.get('/sales/display', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    client.post('/sales/sale', json={"product_id": 1, "quantity": 2}, headers=auth_headers)
+    response = client.get('/sales/display', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_display_goods_etag_covers_query(client, setup_inventory):
+    """Test that projections get their own ETags and equivalent field lists share one."""
+    etag = client.get('/sales/display').headers['ETag']
+
+    response = client.get('/sales/display?fields=name', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json == [{"name": "Item1"}, {"name": "Item2"}]
+    assert response.headers['ETag'] != etag
+
+    response = client.get('/sales/display?fields=price,name', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert client.get('/sales/display?fields=name, price',
+                      headers={"If-None-Match": response.headers['ETag']}).status_code == 304
+
+def test_display_goods_change_by_other_process(client, setup_inventory):
+    """Test that a change committed and bumped by another process invalidates the ETag and the cached listing."""
+    response = client.get('/sales/display')
+    etag = response.headers['ETag']
+
+    with app.app_context():
+        db.session.get(Inventory, 1).price_per_item = 60.0
+        db.session.commit()
+        VersionCounter("catalog").bump()  # Another process has its own counter and cache
+
+    response = client.get('/sales/display', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json[0]["price"] == 60.0
+
 def test_make_sale(client, auth_headers, setup_inventory):
     """Test making a sale."""
     response = client.post('/sales/sale', json={"product_id": 1, "quantity": 2}, headers=auth_headers)
     assert response.status_code == 200
     assert b"Sale completed successfully" in response.data
+    # Without read replicas, writes are not marked for read-your-writes routing
+    assert 'Set-Cookie' not in response.headers
 
     response = client.post('/sales/sale', json={"product_id": 1, "quantity": 20}, headers=auth_headers)
     assert response.status_code == 400
@@ -101,3 +152,104 @@ def test_get_purchase_history(client, auth_headers, setup_inventory):
     assert response.status_code == 200
     assert len(response.json) == 1
     assert response.json[0]['product_name'] == "Item1"
+
+def test_sparse_fieldsets(client, auth_headers, setup_inventory):
+    """Test that listings only return the requested fields and reject unknown ones."""
+    client.post('/sales/sale', json={"product_id": 1, "quantity": 2}, headers=auth_headers)
+
+    response = client.get('/sales/history?fields=product_name,quantity', headers=auth_headers)
+    assert response.json == [{"product_name": "Item1", "quantity": 2}]
+
+    response = client.get('/sales/display?fields=price')
+    assert response.json == [{"price": 50}, {"price": 100}]
+
+    response = client.get('/sales/history?fields=product_name,password', headers=auth_headers)
+    assert response.status_code == 400
+    assert b"fields must be" in response.data
+
+def test_stream_purchase_history(client, auth_headers):
+    """Test streaming the purchase history as NDJSON, filtered by time range."""
+    with app.app_context():
+        for day in (1, 2, 3):
+            db.session.add(Sale(customer_username="testuser", product_id=1, product_name=f"Item{day}",
+                                quantity=1, total_price=50, timestamp=datetime(2024, 1, day)))
+        db.session.add(Sale(customer_username="otheruser", product_id=1, product_name="Other",
+                            quantity=1, total_price=50, timestamp=datetime(2024, 1, 2)))
+        db.session.commit()
+
+    response = client.get('/sales/history?stream=1&since=2024-01-02&until=2024-01-03T12:00:00',
+                          headers=auth_headers)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    sales = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [sale['product_name'] for sale in sales] == ["Item2", "Item3"]
+
+    ndjson_headers = dict(auth_headers, Accept="application/x-ndjson")
+    response = client.get('/sales/history', headers=ndjson_headers)
+    assert len(response.data.decode().splitlines()) == 3
+
+    response = client.get('/sales/history?since=yesterday', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_failed_sale_rolls_back_stock(client, setup_inventory):
+    """Test that a sale refused for lack of funds leaves the stock unchanged."""
+    with app.app_context():
+        db.session.add(User(full_name="Poor User", username="pooruser", password="hashedpassword",
+                            role="customer", wallet_balance=10.0))
+        db.session.commit()
+        token = create_access_token(identity="pooruser")
+
+    response = client.post('/sales/sale', json={"product_id": 1, "quantity": 1},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400
+    assert b"Insufficient wallet balance" in response.data
+
+    with app.app_context():
+        assert db.session.get(Inventory, 1).stock_count == 10
+        assert Sale.query.count() == 0
+
+def test_checkout_cart(client, auth_headers, setup_inventory):
+    """Test buying several products in one order."""
+    response = client.post('/sales/cart', json={"items": [
+        {"product_id": 1, "quantity": 1},
+        {"product_id": 2, "quantity": 1},
+        {"product_id": 1, "quantity": 1},
+    ]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['total_price'] == 200
+    assert sorted((sale['product_name'], sale['quantity']) for sale in response.json['sales']) == [
+        ("Item1", 2), ("Item2", 1)]
+
+    with app.app_context():
+        assert db.session.get(Inventory, 1).stock_count == 8
+        assert db.session.get(Inventory, 2).stock_count == 4
+        assert get_balance(1) == 0
+        assert Sale.query.count() == 2
+
+
+def test_checkout_cart_is_all_or_nothing(client, auth_headers, setup_inventory):
+    """Test that an order with one unavailable line buys nothing."""
+    response = client.post('/sales/cart', json={"items": [
+        {"product_id": 1, "quantity": 1},
+        {"product_id": 2, "quantity": 6},
+    ]}, headers=auth_headers)
+    assert response.status_code == 400
+    assert b"Insufficient stock: 2" in response.data
+
+    response = client.post('/sales/cart', json={"items": [
+        {"product_id": 1, "quantity": 1},
+        {"product_id": 999, "quantity": 1},
+    ]}, headers=auth_headers)
+    assert response.status_code == 404
+
+    response = client.post('/sales/cart', json={"items": [
+        {"product_id": 1, "quantity": 1},
+        {"product_id": 2, "quantity": 2},
+    ]}, headers=auth_headers)
+    assert response.status_code == 400
+    assert b"Insufficient wallet balance" in response.data
+
+    with app.app_context():
+        assert db.session.get(Inventory, 1).stock_count == 10
+        assert db.session.get(Inventory, 2).stock_count == 5
+        assert Sale.query.count() == 0
@@ -0,0 +1,43 @@
+import pytest
+from app import app
+from datetime import datetime
+from decimal import Decimal
+import serialization
+import sys
+import os
+
+# Ensure the test suite can locate the app and services
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PAYLOAD = {"name": "Café", "price": Decimal("9.50"), "timestamp": datetime(2024, 1, 2, 3, 4, 5), "ids": {1: True}}
+EXPECTED = '{"name":"Café","price":"9.50","timestamp":"2024-01-02T03:04:05","ids":{"1":true}}'
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def encoder(request, monkeypatch):
+    """Fixture running a test with orjson (if installed) and with the standard library encoder."""
+    if request.param == "orjson" and serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+    if request.param == "stdlib":
+        monkeypatch.setattr(serialization, "orjson", None)
+    return request.param
+
+
+def test_dumps_is_the_same_with_both_encoders(encoder):
+    """Test that both encoders write compact JSON with ISO 8601 datetimes."""
+    assert app.json.dumps(PAYLOAD) == EXPECTED
+    assert app.json.loads(EXPECTED)["timestamp"] == "2024-01-02T03:04:05"
+
+
+def test_json_response(encoder):
+    """Test that jsonify goes through the provider."""
+    with app.app_context():
+        response = app.json.response(PAYLOAD)
+    assert response.mimetype == "application/json"
+    assert response.get_data(as_text=True) == EXPECTED
+
+
+def test_unsupported_type_raises(encoder):
+    """Test that objects without a JSON representation are rejected."""
+    with pytest.raises(TypeError):
+        app.json.dumps({"value": object()})
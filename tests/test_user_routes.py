@@ -1,8 +1,13 @@
 import pytest
 from app import app, db
 from services.customers.models import User
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, decode_token
+from services.customers import passwords, wallet
+from services.customers.models import WalletEntry, WalletSnapshot
+from services.customers.auth import RevocationList, revocation_list
 import sys
+import threading
+import time
 import os
 
 # Ensure the test suite can locate the app and services
@@ -21,6 +26,7 @@ def client():
         with app.app_context():
             db.drop_all()
             db.create_all()  # Initialize tables
+            revocation_list.clear()  # Revocations outlive the recreated users
             print(app.url_map)  # Add this line to debug registered routes
 
         yield client
@@ -110,6 +116,68 @@ def test_login_user(client):
     assert b"Login successful" in response.data
 
 
+def test_login_token_carries_role_claims(client):
+    """Test that the login token carries the role and id of the user."""
+    client.post('/user/register', json={
+        "full_name": "John Doe",
+        "username": "johndoe",
+        "password": "securepassword123",
+        "age": 30,
+        "address": "123 Main Street",
+        "gender": "Male",
+        "marital_status": "Single"
+    })
+    response = client.post('/user/login', json={
+        "username": "johndoe",
+        "password": "securepassword123"
+    })
+    with app.app_context():
+        claims = decode_token(response.json['token'])
+    assert claims['sub'] == "johndoe"
+    assert claims['role'] == "customer"
+    assert claims['uid'] == 1
+
+
+def test_login_rejected_when_password_pool_saturated(client, monkeypatch):
+    """Test that login answers 503 with Retry-After while the password pool is full."""
+    client.post('/user/register', json={
+        "full_name": "John Doe",
+        "username": "johndoe",
+        "password": "securepassword123",
+        "age": 30,
+        "address": "123 Main Street",
+        "gender": "Male",
+        "marital_status": "Single"
+    })
+    pool = passwords.PasswordPool(workers=1, queue_size=0)
+    monkeypatch.setattr(passwords, "password_pool", pool)
+    started, release = threading.Event(), threading.Event()
+
+    def occupy_worker():
+        started.set()
+        release.wait()
+
+    blocker = threading.Thread(target=pool.run, args=(occupy_worker,))
+    blocker.start()
+    started.wait()  # The blocking operation holds the only slot
+    try:
+        response = client.post('/user/login', json={
+            "username": "johndoe",
+            "password": "securepassword123"
+        })
+    finally:
+        release.set()
+        blocker.join()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == "1"
+
+    response = client.post('/user/login', json={
+        "username": "johndoe",
+        "password": "securepassword123"
+    })
+    assert response.status_code == 200
+
+
 def test_login_invalid_user(client):
     """Test login with invalid credentials."""
     response = client.post('/user/login', json={
@@ -146,6 +214,35 @@ def test_get_all_users(client, auth_headers):
     assert len(response.json) == 3  # Includes testuser
 
 
+def test_get_users_keyset_pagination(client, auth_headers):
+    """Test paging through users with limit/after and the X-Next-Cursor header."""
+    with app.app_context():
+        for index in range(4):
+            db.session.add(User(full_name=f"User {index}", username=f"user{index}", password="hashedpassword",
+                                role="customer", wallet_balance=0.0))
+        db.session.commit()
+
+    response = client.get('/user/?limit=3')
+    assert response.status_code == 200
+    assert [user['id'] for user in response.json] == [1, 2, 3]
+    assert "password" not in response.json[0]
+    assert response.headers['X-Next-Cursor'] == "3"
+
+    response = client.get('/user/?limit=3&after=3')
+    assert [user['id'] for user in response.json] == [4, 5]
+    assert 'X-Next-Cursor' not in response.headers
+
+    response = client.get('/user/?limit=0')
+    assert response.status_code == 400
+
+
+def test_export_users(client, auth_headers):
+    """Test streaming all users as one JSON array."""
+    response = client.get('/user/?export=true')
+    assert response.status_code == 200
+    assert [user['username'] for user in response.json] == ["johndoe"]
+
+
 def test_get_user_by_id(client, auth_headers):
     """Test fetching a user by ID."""
     client.post('/user/register', json={
@@ -173,6 +270,55 @@ def test_delete_user(client, auth_headers):
     assert b"Customer not found" in response.data
 
 
+def test_deleted_user_token_revoked(client, auth_headers):
+    """Test that tokens issued before a user was deleted are rejected."""
+    with app.app_context():
+        old_token = create_access_token(
+            identity="johndoe",
+            additional_claims={"role": "customer", "uid": 1, "iat": int(time.time()) - 60}
+        )
+    old_headers = {"Authorization": f"Bearer {old_token}"}
+
+    response = client.delete('/user/delete', headers=auth_headers)
+    assert response.status_code == 200
+
+    response = client.post('/user/wallet/charge', json={"amount": 10}, headers=old_headers)
+    assert response.status_code == 401
+
+
+def test_token_revoked_in_same_second(monkeypatch):
+    """Test that a token issued in the second of the revocation is rejected."""
+    monkeypatch.setattr(time, "time", lambda: 1_000_000.5)
+    revocations = RevocationList()
+    revocations.revoke("johndoe")
+    now = 1_000_000
+    assert revocations.is_revoked("johndoe", now - 1)
+    assert revocations.is_revoked("johndoe", now)
+    assert not revocations.is_revoked("johndoe", now + 1)
+    assert not revocations.is_revoked("janedoe", now)
+
+
+def test_deleted_user_wallet_not_inherited(client, auth_headers):
+    """Test that a new user reusing the id of a deleted one starts with an empty wallet."""
+    client.post('/user/wallet/charge', json={"amount": 500}, headers=auth_headers)
+    with app.app_context():
+        wallet.compact(lag=0)
+    client.post('/user/wallet/charge', json={"amount": 5}, headers=auth_headers)
+    assert client.delete('/user/delete', headers=auth_headers).status_code == 200
+
+    response = client.post('/user/register', json={
+        "full_name": "Bob", "username": "bob", "password": "password123",
+        "age": 40, "address": "1 Main St", "gender": "Male", "marital_status": "Single"
+    })
+    assert response.status_code == 201
+    response = client.get('/user/1')
+    assert response.json['username'] == "bob"
+    assert response.json['wallet_balance'] == 0.0
+    with app.app_context():
+        token = create_access_token(identity="bob")
+    response = client.post('/user/wallet/deduct', json={"amount": 400}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400
+
 def test_update_user(client, auth_headers):
     """Test updating user information."""
     response = client.patch('/user/update', json={
@@ -196,9 +342,51 @@ def test_charge_wallet(client, auth_headers):
     assert b"successfully added to wallet" in response.data
 
 
+def test_charge_wallet_unknown_user(client, auth_headers):
+    """Test that charging the wallet of a missing user writes no ledger entry."""
+    with app.app_context():
+        token = create_access_token(identity="ghost", additional_claims={"role": "customer", "uid": 42})
+    response = client.post('/user/wallet/charge', json={"amount": 50}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
+    with app.app_context():
+        assert db.session.execute(db.select(db.func.count()).select_from(WalletEntry)).scalar() == 0
+
+
 def test_deduct_wallet(client, auth_headers):
     """Test deducting funds from the wallet of the logged-in user."""
     response = client.post('/user/wallet/deduct', json={"amount": 30}, headers=auth_headers)
     assert response.status_code == 200
     assert b"successfully deducted from wallet" in response.data
 
+
+
+def test_wallet_ledger_balance(client, auth_headers):
+    """Test that charges and deductions are applied to the opening balance."""
+    response = client.post('/user/wallet/charge', json={"amount": 50.25}, headers=auth_headers)
+    assert response.json['wallet_balance'] == 150.25
+
+    response = client.post('/user/wallet/deduct', json={"amount": 0.25}, headers=auth_headers)
+    assert response.json['wallet_balance'] == 150.0
+
+    response = client.post('/user/wallet/deduct', json={"amount": 150.01}, headers=auth_headers)
+    assert response.status_code == 400
+    assert b"Insufficient funds" in response.data
+
+    response = client.get('/user/1')
+    assert response.json['wallet_balance'] == 150.0
+
+
+def test_wallet_compaction_keeps_balance(client, auth_headers):
+    """Test that folding entries into a snapshot does not change the balance."""
+    client.post('/user/wallet/charge', json={"amount": 20}, headers=auth_headers)
+    client.post('/user/wallet/deduct', json={"amount": 5}, headers=auth_headers)
+
+    with app.app_context():
+        assert wallet.compact(lag=0) == 1
+        snapshot = db.session.get(WalletSnapshot, 1)
+        assert snapshot.balance_cents == 11500
+        assert wallet.compact(lag=0) == 0
+
+    client.post('/user/wallet/charge', json={"amount": 1}, headers=auth_headers)
+    response = client.get('/user/')
+    assert response.json[0]['wallet_balance'] == 116.0
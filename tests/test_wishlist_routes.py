@@ -3,6 +3,7 @@ from app import app, db
 from services.wishlist.models import Wishlist
 from services.inventory.models import Inventory
 from services.customers.models import User
+from services.inventory.cache import catalog_cache
 from flask_jwt_extended import create_access_token
 import sys
 import os
@@ -23,6 +24,7 @@ def client():
         with app.app_context():
             db.drop_all()
             db.create_all()  # Initialize tables
+            catalog_cache.clear()  # The cache outlives the recreated tables
         yield client
         with app.app_context():
             db.session.remove()
@@ -1,90 +1,608 @@
+import atexit
 import cProfile
+import glob
+import io
 import pstats
+import queue
 from line_profiler import LineProfiler
 import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
 from functools import wraps
+from flask import has_request_context, request
 from memory_profiler import memory_usage
 
-PROFILE_OUTPUT_FILE = "route_profile.prof"
+# All profiling artifacts are written below this directory by the profiling sink
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "profiles")
+PROFILE_OUTPUT_FILE = "route_profile.collapsed"
 LINE_PROFILE_OUTPUT_FILE = "line_profile_output.txt"
+MEMORY_PROFILE_OUTPUT_FILE = "memory_profile_output.txt"
+PSTATS_OUTPUT_DIR = "pstats"
+
+# 'sampling' (default), 'cprofile' (deterministic, slow) or 'off'
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")
+PROFILE_SAMPLING_INTERVAL = float(os.getenv("PROFILE_SAMPLING_INTERVAL", "0.005"))
+PROFILE_FLUSH_INTERVAL = float(os.getenv("PROFILE_FLUSH_INTERVAL", "30"))
+
+# 'tracemalloc' (default), 'memory_profiler' (blocking RSS sampling) or 'off'
+MEMORY_PROFILE_MODE = os.getenv("MEMORY_PROFILE_MODE", "tracemalloc")
+MEMORY_PROFILE_FRAMES = int(os.getenv("MEMORY_PROFILE_FRAMES", "1"))
+# Heap snapshots for allocation sites are expensive (about 1s per million live
+# allocations), so they are only taken on every Nth request when N > 0
+MEMORY_SNAPSHOT_EVERY = int(os.getenv("MEMORY_SNAPSHOT_EVERY", "0"))
+
+# Profiling sink: queue bound and file rotation
+PROFILE_QUEUE_SIZE = int(os.getenv("PROFILE_QUEUE_SIZE", "1000"))
+PROFILE_ROTATE_BYTES = int(os.getenv("PROFILE_ROTATE_BYTES", str(10 * 1024 * 1024)))
+PROFILE_ROTATE_SECONDS = float(os.getenv("PROFILE_ROTATE_SECONDS", "3600"))
+PROFILE_BACKUP_COUNT = int(os.getenv("PROFILE_BACKUP_COUNT", "24"))
+
+
+def _endpoint_name(func):
+    """
+    Name used to group profiling results: the Flask endpoint (e.g. 'sales.make_sale')
+    when called inside a request, otherwise the function name.
+    """
+    if has_request_context() and request.endpoint:
+        return request.endpoint
+    return func.__name__
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _prune(pattern, keep):
+    """Delete all but the ``keep`` most recent files matching ``pattern``."""
+    files = sorted(glob.glob(pattern), key=os.path.getmtime)
+    for path in files[:max(len(files) - keep, 0)]:
+        os.remove(path)
+
+
+class RotatingFile:
+    """
+    Append-only text file rotated when it grows past ``max_bytes`` or gets older
+    than ``max_age`` seconds. Rotated files are renamed with a timestamp and
+    rotation number suffix, unique even for several rotations within a second,
+    and only the ``backup_count`` most recent ones are kept.
+    """
+
+    def __init__(self, path, max_bytes=PROFILE_ROTATE_BYTES, max_age=PROFILE_ROTATE_SECONDS,
+                 backup_count=PROFILE_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self._file = None
+        self._opened_at = None
+        self._rotations = 0
+
+    def write(self, text):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a")
+            self._opened_at = time.monotonic()
+        self._file.write(text)
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes or time.monotonic() - self._opened_at >= self.max_age:
+            self.rotate()
+
+    def rotate(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        root, ext = os.path.splitext(self.path)
+        self._rotations += 1
+        os.replace(self.path, f"{root}.{time.strftime('%Y%m%d-%H%M%S')}-{self._rotations}{ext}")
+        _prune(f"{root}.*{ext}", self.backup_count)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ProfilingSink:
+    """
+    Shared, non-blocking output pipeline for the profiling decorators.
+
+    Decorators hand their raw results to :meth:`submit`, which only puts them on
+    a bounded queue; when the queue is full the result is dropped and counted in
+    :attr:`dropped` so a request never waits on profiling I/O. A background
+    writer thread formats the results and appends them to rotating files below
+    ``output_dir``. cProfile results are merged per endpoint and dumped as binary
+    pstats files (``pstats/<endpoint>.<timestamp>.prof``), which can be loaded
+    and combined later with ``pstats.Stats(*paths)``.
+
+    Results that fail to be formatted or written (e.g. a line profile corrupted
+    by concurrent profilers) are skipped and counted in :attr:`failed`.
+
+    Components that aggregate in memory register a flusher with
+    :meth:`register_flusher`; it is called from the writer thread every
+    ``flush_interval`` seconds and its text output is appended to its file.
+    """
+
+    def __init__(self, output_dir=PROFILE_OUTPUT_DIR, maxsize=PROFILE_QUEUE_SIZE,
+                 flush_interval=PROFILE_FLUSH_INTERVAL, backup_count=PROFILE_BACKUP_COUNT):
+        self.output_dir = output_dir
+        self.flush_interval = flush_interval
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._files = {}
+        self._flushers = []
+        self._pstats = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the writer thread if it is not running yet."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiling-sink", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, kind, name, payload):
+        """
+        Queue a profiling result without blocking.
+
+        :param kind: ``'text'`` (payload is a string appended to file ``name``),
+                     ``'line_profile'`` (payload is a disabled LineProfiler) or
+                     ``'pstats'`` (payload is a disabled cProfile.Profile, ``name``
+                     is the endpoint).
+        :return: False if the result was dropped because the queue is full.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((kind, name, payload))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def register_flusher(self, filename, callback):
+        """
+        Periodically append the text returned by ``callback()`` to ``filename``.
+        The callback runs on the writer thread and may return None when there is
+        nothing to write.
+        """
+        with self._lock:
+            self._flushers.append((filename, callback))
+        self.start()
+
+    def close(self):
+        """Stop the writer thread after writing everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _file(self, filename):
+        if filename not in self._files:
+            self._files[filename] = RotatingFile(os.path.join(self.output_dir, filename),
+                                                 backup_count=self.backup_count)
+        return self._files[filename]
+
+    def _handle(self, kind, name, payload):
+        if kind == "pstats":
+            if name in self._pstats:
+                self._pstats[name].add(payload)
+            else:
+                self._pstats[name] = pstats.Stats(payload)
+        elif kind == "line_profile":
+            stream = io.StringIO()
+            payload.print_stats(stream=stream)
+            self._file(LINE_PROFILE_OUTPUT_FILE).write(f"\nProfiling results for function: {name}\n{stream.getvalue()}")
+        else:
+            self._file(name).write(payload)
+
+    def _flush_one(self, filename, callback):
+        text = callback()
+        if text:
+            self._file(filename).write(text)
+
+    def _safely(self, func, *args):
+        # A result that cannot be formatted or written must not stop the writer
+        # thread, or every later result would pile up in the queue unwritten
+        try:
+            func(*args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+
+    def _flush(self):
+        with self._lock:
+            flushers = list(self._flushers)
+        for filename, callback in flushers:
+            self._safely(self._flush_one, filename, callback)
+
+        collected, self._pstats = self._pstats, {}
+        suffix = time.strftime("%Y%m%d-%H%M%S")
+        for endpoint, stats in collected.items():
+            self._safely(self._dump_pstats, endpoint, stats, suffix)
+
+    def _dump_pstats(self, endpoint, stats, suffix):
+        pstats_dir = os.path.join(self.output_dir, PSTATS_OUTPUT_DIR)
+        os.makedirs(pstats_dir, exist_ok=True)
+        stats.dump_stats(os.path.join(pstats_dir, f"{endpoint}.{suffix}.prof"))
+        _prune(os.path.join(pstats_dir, f"{endpoint}.*.prof"), self.backup_count)
+
+    def _drain(self, timeout):
+        """Handle queued results, waiting up to ``timeout`` seconds for the first one."""
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            self._safely(self._handle, *item)
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            self._drain(timeout=min(1.0, max(next_flush - time.monotonic(), 0)))
+            if time.monotonic() >= next_flush:
+                self._flush()
+                next_flush = time.monotonic() + self.flush_interval
+        self._drain(timeout=0)
+        self._flush()
+        for file in self._files.values():
+            file.close()
+
+
+profiling_sink = ProfilingSink()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for Flask route handlers.
+
+    Request threads only register themselves while a profiled handler runs; a
+    background thread wakes up every ``interval`` seconds, captures the Python
+    stacks of the registered threads and counts them per endpoint. The counts
+    are written by :data:`profiling_sink` in collapsed-stack format
+    (``endpoint;frame;frame count``), ready for flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLING_INTERVAL, sink=profiling_sink,
+                 output_file=PROFILE_OUTPUT_FILE):
+        self.interval = interval
+        self.sink = sink
+        self.output_file = output_file
+        self._active = {}  # thread id -> (endpoint, frame of the profiling wrapper)
+        self._samples = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the sampling thread if it is not running yet."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="route-sampler", daemon=True)
+                self._thread.start()
+                self.sink.register_flusher(self.output_file, self.collect)
+
+    def register(self, endpoint, frame):
+        """Mark the calling thread as serving ``endpoint`` until :meth:`unregister`."""
+        self._active[threading.get_ident()] = (endpoint, frame)
+
+    def unregister(self):
+        self._active.pop(threading.get_ident(), None)
+
+    def sample(self):
+        """Take one sample of every registered thread."""
+        active = dict(self._active)
+        if not active:
+            return
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, (endpoint, root) in active.items():
+                frame = frames.get(ident)
+                stack = []
+                # Walk from the innermost frame up to the profiling wrapper
+                while frame is not None and frame is not root:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    stack.append(endpoint)
+                    self._samples[";".join(reversed(stack))] += 1
+
+    def collect(self):
+        """Return the samples taken since the last call as collapsed stacks and reset them."""
+        with self._lock:
+            samples, self._samples = self._samples, Counter()
+        return "".join(f"{stack} {count}\n" for stack, count in samples.items())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+
+sampling_profiler = SamplingProfiler()
+
 
 def profile_route(func):
     """
     A decorator to profile specific Flask route handlers.
-    Captures and saves cumulative execution stats for visualization.
+
+    The behaviour depends on ``PROFILE_MODE``:
+
+    - ``sampling`` (default): the handler is sampled by :data:`sampling_profiler`,
+      which adds no measurable latency and writes collapsed stacks per endpoint.
+    - ``cprofile``: a deterministic cProfile run for every call. The profiles are
+      merged per endpoint and dumped as binary pstats files by the profiling sink.
+      Much slower, use for local debugging.
+    - ``off``: the handler is called unchanged.
 
     :param func: The Flask route handler to profile.
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
+        if PROFILE_MODE == "sampling":
+            sampling_profiler.start()
+            sampling_profiler.register(_endpoint_name(func), sys._getframe())
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sampling_profiler.unregister()
+
+        if PROFILE_MODE != "cprofile":
+            return func(*args, **kwargs)
+
         # Initialize the profiler
         profiler = cProfile.Profile()
         profiler.enable()
+        try:
+            # Call the actual route function
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            # Stats are built and written by the sink's writer thread
+            profiling_sink.submit("pstats", _endpoint_name(func), profiler)
 
-        # Call the actual route function
-        result = func(*args, **kwargs)
-
-        profiler.disable()
-
-        # Save profiling stats for only the current route to a file
-        if os.path.exists(PROFILE_OUTPUT_FILE):
-            # Append to existing file
-            with open(PROFILE_OUTPUT_FILE, "a") as file:
-                stats = pstats.Stats(profiler, stream=file)
-                stats.strip_dirs().sort_stats("cumulative")
-                stats.print_stats(2)  # Only print the top 2 lines (relevant stats)
-        else:
-            # Create a new file
-            with open(PROFILE_OUTPUT_FILE, "w") as file:
-                stats = pstats.Stats(profiler, stream=file)
-                stats.strip_dirs().sort_stats("cumulative")
-                stats.print_stats(2)
+    return wrapper
 
-        return result
+_line_profiler_lock = threading.Lock()
 
-    return wrapper
 
 def line_profile(func):
     """
     Decorator to enable line profiling for the given function.
-    Requires the 'line_profiler' tool.
+    Requires the 'line_profiler' tool. The results are formatted and written
+    by the profiling sink, outside of the request.
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
-        # Initialize the line profiler
+        # Initialize the line profiler; registration walks state shared by
+        # all LineProfiler instances, which is not safe to do concurrently
         profiler = LineProfiler()
-        profiler.add_function(func)  # Add the function to the profiler
+        with _line_profiler_lock:
+            profiler.add_function(func)  # Add the function to the profiler
 
         # Profile the function call
         profiler.enable()
-        result = func(*args, **kwargs)
-        profiler.disable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiling_sink.submit("line_profile", func.__name__, profiler)
 
-        # Save profiling stats to a text file
-        with open(LINE_PROFILE_OUTPUT_FILE, "a") as file:
-            file.write(f"\nProfiling results for function: {func.__name__}\n")
-            profiler.print_stats(stream=file)
+    return wrapper
 
-        return result
+class AllocationTracker:
+    """
+    Per-endpoint allocation accounting based on tracemalloc.
+
+    For every request the net and peak number of bytes allocated by the handler
+    are read from tracemalloc's counters, which costs a few microseconds. When
+    ``snapshot_every`` is set, every ``snapshot_every``-th request of an endpoint
+    also takes heap snapshots around the handler; taking a snapshot is the only
+    part that costs the request time, the snapshots are compared on the sink's
+    writer thread to find the top allocation sites. Results are aggregated in
+    memory and written by :data:`profiling_sink` at every flush.
+
+    tracemalloc counters are process-wide, so with concurrent requests the
+    numbers for one request include allocations made by other threads. The
+    peak can only be reset for the whole process, so it is measured only for
+    requests that ran alone (see :meth:`enter`) and left out for the others.
+    """
+
+    def __init__(self, frames=MEMORY_PROFILE_FRAMES, snapshot_every=MEMORY_SNAPSHOT_EVERY,
+                 sink=profiling_sink, output_file=MEMORY_PROFILE_OUTPUT_FILE, top_sites=10):
+        self.frames = frames
+        self.snapshot_every = snapshot_every
+        self.sink = sink
+        self.output_file = output_file
+        self.top_sites = top_sites
+        self._stats = {}
+        self._snapshots = {}  # endpoint -> (before, after) of its latest sampled request
+        self._lock = threading.Lock()
+        self._started = False
+        self._in_flight = 0
+        self._entries = 0
+
+    def enter(self):
+        """
+        Note that a profiled request started.
+
+        :return: A token for :meth:`exit`, and whether the request is alone so
+                 far, in which case the caller resets the tracemalloc peak.
+        """
+        with self._lock:
+            alone = self._in_flight == 0
+            self._in_flight += 1
+            self._entries += 1
+            return (self._entries, alone), alone
+
+    def exit(self, token):
+        """
+        Note that a profiled request ended.
+
+        :return: Whether it ran alone from start to end, i.e. whether the peak
+                 read now belongs to it only.
+        """
+        entry, alone = token
+        with self._lock:
+            self._in_flight -= 1
+            return alone and self._entries == entry
+
+    def start(self):
+        """Start tracing allocations if not done yet."""
+        if self._started:
+            return
+        with self._lock:
+            if not self._started:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(self.frames)
+                self.sink.register_flusher(self.output_file, self.collect)
+                self._started = True
+
+    def _endpoint_stats(self, endpoint):
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            stats = self._stats[endpoint] = {
+                "requests": 0, "net_total": 0, "net_max": 0,
+                "peak_requests": 0, "peak_total": 0, "peak_max": 0, "sites": Counter(),
+            }
+        return stats
+
+    def should_snapshot(self, endpoint):
+        """Whether the next request to ``endpoint`` should record allocation sites."""
+        stats = self._stats.get(endpoint)
+        requests = stats["requests"] if stats else 0
+        return self.snapshot_every > 0 and requests % self.snapshot_every == self.snapshot_every - 1
+
+    def record(self, endpoint, net, peak, snapshots=None):
+        """
+        Add one request to the aggregates of ``endpoint``.
+
+        :param net: Bytes still allocated after the handler returned.
+        :param peak: Highest number of bytes allocated while the handler ran, or
+                     None if other requests ran at the same time.
+        :param snapshots: Optional (before, after) tracemalloc snapshots of the request,
+                          compared at the next :meth:`collect`.
+        """
+        with self._lock:
+            stats = self._endpoint_stats(endpoint)
+            stats["requests"] += 1
+            stats["net_total"] += net
+            stats["net_max"] = max(stats["net_max"], net)
+            if peak is not None:
+                stats["peak_requests"] += 1
+                stats["peak_total"] += peak
+                stats["peak_max"] = max(stats["peak_max"], peak)
+            if snapshots:
+                self._snapshots[endpoint] = snapshots
+
+    def collect(self):
+        """Return the aggregated stats since the last call as text and reset them."""
+        with self._lock:
+            collected, self._stats = self._stats, {}
+            snapshots, self._snapshots = self._snapshots, {}
+        if not collected:
+            return None
+        for endpoint, (before, after) in snapshots.items():
+            if endpoint in collected:
+                collected[endpoint]["sites"].update(_allocation_sites(before, after, self.top_sites))
+        lines = [f"\nMemory profiling window ending {time.strftime('%Y-%m-%d %H:%M:%S')}\n"]
+        for endpoint, stats in sorted(collected.items()):
+            requests = stats["requests"]
+            lines.append(f"\nEndpoint: {endpoint} ({requests} requests)\n")
+            lines.append(f"Net allocated: avg {stats['net_total'] // requests} B, max {stats['net_max']} B\n")
+            if stats["peak_requests"]:
+                lines.append(f"Peak allocated: avg {stats['peak_total'] // stats['peak_requests']} B, "
+                             f"max {stats['peak_max']} B ({stats['peak_requests']} requests that ran alone)\n")
+            if stats["sites"]:
+                lines.append("Top allocation sites:\n")
+                for site, size in stats["sites"].most_common(self.top_sites):
+                    lines.append(f"  {site}: {size} B\n")
+        return "".join(lines)
+
+
+allocation_tracker = AllocationTracker()
+
+
+def _allocation_sites(before, after, limit):
+    """Top allocation sites between two tracemalloc snapshots, as {"file:line": bytes}."""
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ]
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    return {
+        str(stat.traceback): stat.size_diff
+        for stat in diff[:limit]
+        if stat.size_diff > 0
+    }
 
-    return wrapper
 
 def memory_profile(func):
     """
     A decorator to measure memory usage of the function.
-    Uses memory_profiler to log memory before and after the function call.
+
+    The behaviour depends on ``MEMORY_PROFILE_MODE``:
+
+    - ``tracemalloc`` (default): per-request net and peak allocated bytes, plus
+      top allocation sites on sampled requests (``MEMORY_SNAPSHOT_EVERY``), aggregated per endpoint by
+      :data:`allocation_tracker` and flushed periodically.
+    - ``memory_profiler``: samples process memory before and after the call with
+      memory_profiler. Each sample sleeps for about one second, so this adds two
+      seconds to every request; use for local debugging only.
+    - ``off``: the function is called unchanged.
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
+        if MEMORY_PROFILE_MODE == "tracemalloc":
+            allocation_tracker.start()
+            endpoint = _endpoint_name(func)
+            snapshot = allocation_tracker.should_snapshot(endpoint)
+            before_snapshot = tracemalloc.take_snapshot() if snapshot else None
+
+            token, alone = allocation_tracker.enter()
+            before, _ = tracemalloc.get_traced_memory()
+            if alone:
+                # The peak is process-wide; resetting it under a concurrent request would corrupt that one's
+                tracemalloc.reset_peak()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                after, peak = tracemalloc.get_traced_memory()
+                peak = max(peak - before, 0) if allocation_tracker.exit(token) else None
+                snapshots = (before_snapshot, tracemalloc.take_snapshot()) if snapshot else None
+                allocation_tracker.record(endpoint, after - before, peak, snapshots)
+
+        if MEMORY_PROFILE_MODE != "memory_profiler":
+            return func(*args, **kwargs)
+
         mem_usage_before = memory_usage(-1, interval=0.1, timeout=1)
         result = func(*args, **kwargs)
         mem_usage_after = memory_usage(-1, interval=0.1, timeout=1)
 
         # Log memory usage stats
-        with open("memory_profile_output.txt", "a") as file:
-            file.write(f"\nMemory profiling for function: {func.__name__}\n")
-            file.write(f"Memory before: {mem_usage_before} MB\n")
-            file.write(f"Memory after: {mem_usage_after} MB\n")
+        profiling_sink.submit(
+            "text",
+            MEMORY_PROFILE_OUTPUT_FILE,
+            f"\nMemory profiling for function: {func.__name__}\n"
+            f"Memory before: {mem_usage_before} MB\n"
+            f"Memory after: {mem_usage_after} MB\n",
+        )
 
         return result
 